@@ -0,0 +1,78 @@
+"""Bytes fetched and wall time for a clipped YouTube-style job: --download-sections vs. CLIP_FETCH.
+
+A loopback server (benchmarks/loopback.py) serves a long AAC fixture behind a page that
+yt-dlp's generic extractor resolves like a real video page.
+
+Run from the project root (needs ffmpeg on PATH):
+    python benchmarks/bench_clip_fetch.py --minutes 20 --start 600 --runs 3
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("API_KEY", "bench")
+
+from config import settings  # noqa: E402
+from core.extractor import _download_youtube, _resolve_bin  # noqa: E402
+from loopback import serve, served, write_page  # noqa: E402
+
+
+async def _make_fixture(directory: str, minutes: int) -> None:
+    media = os.path.join(directory, "fixture.m4a")
+    proc = await asyncio.create_subprocess_exec(
+        *_resolve_bin("ffmpeg"), "-f", "lavfi", "-i", f"sine=frequency=440:duration={minutes * 60}",
+        "-acodec", "aac", "-ab", "128k", "-movflags", "+faststart", "-y", media,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    _, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise SystemExit(stderr.decode(errors="replace"))
+
+
+async def _run_once(clip_fetch: bool, page: str, window: tuple, out_dir: str) -> tuple[float, int, int]:
+    settings.CLIP_FETCH = clip_fetch
+    job_id = f"bench-{'fetch' if clip_fetch else 'sections'}"
+    final_path = Path(out_dir) / f"{job_id}.{settings.AUDIO_FORMAT}"
+    served["bytes"] = 0
+    t0 = time.perf_counter()
+    await _download_youtube(job_id, page, window, final_path)
+    elapsed = time.perf_counter() - t0
+    size = final_path.stat().st_size
+    final_path.unlink()
+    return elapsed, served["bytes"], size
+
+
+async def main(minutes: int, start: int, runs: int) -> None:
+    with tempfile.TemporaryDirectory() as media_dir, tempfile.TemporaryDirectory() as out_dir:
+        settings.TEMP_DIR = out_dir
+        settings.COOKIES_FILE = ""
+        settings.PROXY = ""
+        await _make_fixture(media_dir, minutes)
+        server, port = serve(media_dir)
+        page = write_page(media_dir, port, "fixture.m4a", minutes * 60)
+        window = (start, start + settings.AUDIO_CLIP_SECONDS)
+        fixture_bytes = os.path.getsize(os.path.join(media_dir, "fixture.m4a"))
+
+        print(f"fixture: {minutes} min AAC ({fixture_bytes / 1e6:.1f} MB), clip {window[0]}-{window[1]}s, {runs} runs")
+        for label, clip_fetch in (("--download-sections", False), ("CLIP_FETCH", True)):
+            results = [await _run_once(clip_fetch, page, window, out_dir) for _ in range(runs)]
+            wall = statistics.median(r[0] for r in results)
+            fetched = statistics.median(r[1] for r in results)
+            print(f"{label:20}: median {wall * 1000:8.1f} ms  fetched {fetched / 1e6:7.2f} MB  output {results[-1][2]} B")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--minutes", type=int, default=20)
+    parser.add_argument("--start", type=int, default=600)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.minutes, args.start, args.runs))
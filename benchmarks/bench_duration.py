@@ -0,0 +1,61 @@
+"""Latency of finding a job's duration: ffprobe spawn vs. parsing output we already have.
+
+Run from the project root (needs ffmpeg + ffprobe on PATH):
+    python benchmarks/bench_duration.py --runs 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("API_KEY", "bench")
+
+from core.extractor import _ffmpeg_output_seconds, _get_duration, _resolve_bin  # noqa: E402
+
+
+async def _make_fixture(path: str, seconds: int) -> bytes:
+    proc = await asyncio.create_subprocess_exec(
+        *_resolve_bin("ffmpeg"), "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+        "-acodec", "libmp3lame", "-ab", "128k", "-y", path,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    _, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise SystemExit(stderr.decode(errors="replace"))
+    return stderr
+
+
+async def main(runs: int, seconds: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "fixture.mp3")
+        stderr = await _make_fixture(path, seconds)
+
+        probe_ms = []
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            probed = await _get_duration(path)
+            probe_ms.append((time.perf_counter() - t0) * 1000)
+
+        parse_ms = []
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            parsed = _ffmpeg_output_seconds(stderr)
+            parse_ms.append((time.perf_counter() - t0) * 1000)
+
+    print(f"fixture: {seconds}s mp3, {runs} runs")
+    print(f"ffprobe spawn : median {statistics.median(probe_ms):8.3f} ms  (duration={probed})")
+    print(f"stderr parse  : median {statistics.median(parse_ms):8.3f} ms  (duration={parsed})")
+    print(f"saved per job : {statistics.median(probe_ms) - statistics.median(parse_ms):8.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--seconds", type=int, default=30)
+    args = parser.parse_args()
+    asyncio.run(main(args.runs, args.seconds))
@@ -0,0 +1,333 @@
+"""Load test of the real app: jobs/sec, end-to-end latency percentiles, peak RSS and
+CPU-seconds per audio minute for the upload and YouTube paths — fully offline.
+
+Fixtures (every duration × container/codec) are generated with ffmpeg. For the YouTube
+path a loopback server (benchmarks/loopback.py) stands in for YouTube: the real yt-dlp
+resolves its pages with the generic extractor. Each path gets a fresh uvicorn server in a
+child process; CPU is the server's own plus its reaped yt-dlp/ffmpeg children over the
+timed window, RSS the peak of the whole process tree (sampled from /proc, so Linux only).
+
+A job's latency runs from submit to its result being downloaded; completion is taken
+from /jobs/{id}/events, so there is no polling interval in the numbers.
+
+Run from the project root (needs ffmpeg on PATH):
+    python benchmarks/bench_load.py --jobs 40 --concurrency 8
+    python benchmarks/bench_load.py --paths youtube --durations 30,600 --json baseline.json
+
+Service settings (NORMALIZE_MODE, AUDIO_FORMAT, TRANSCODE_CONCURRENCY, ...) come from the
+environment as usual and are passed through to the server.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("API_KEY", "bench")
+
+from core.extractor import _resolve_bin  # noqa: E402
+from loopback import serve, write_page  # noqa: E402
+
+HEADERS = {"X-API-Key": os.environ["API_KEY"]}
+TERMINAL = {"done", "failed", "cancelled"}
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+_CLK_TCK = os.sysconf("SC_CLK_TCK")
+
+# name -> (extension, upload Content-Type, ffmpeg codec options)
+CONTAINERS = {
+    "mp4-aac": ("mp4", "video/mp4", [
+        "-c:v", "mpeg4", "-c:a", "aac", "-b:a", "128k", "-movflags", "+faststart",
+    ]),
+    "webm-opus": ("webm", "video/webm", [
+        "-c:v", "libvpx", "-deadline", "realtime", "-b:v", "100k", "-c:a", "libopus", "-b:a", "96k",
+    ]),
+    "mkv-mp3": ("mkv", "video/x-matroska", [
+        "-c:v", "mpeg4", "-c:a", "libmp3lame", "-b:a", "128k",
+    ]),
+}
+
+
+@dataclass
+class Fixture:
+    name: str
+    path: str
+    content_type: str
+    seconds: int
+    page: str = ""
+
+
+async def _make_fixture(path: str, seconds: int, codec_args: list[str]) -> None:
+    # Seeded pink noise: deterministic across runs, and not trivially compressible like a sine
+    proc = await asyncio.create_subprocess_exec(
+        *_resolve_bin("ffmpeg"),
+        "-f", "lavfi", "-i", f"testsrc2=size=160x120:rate=5:duration={seconds}",
+        "-f", "lavfi", "-i", f"anoisesrc=color=pink:amplitude=0.1:seed=7:duration={seconds}",
+        *codec_args, "-shortest", "-y", path,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    _, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise SystemExit(stderr.decode(errors="replace")[-2000:])
+
+
+async def _fixtures(directory: str, durations: list[int]) -> list[Fixture]:
+    """Generate (or reuse, with --fixtures) one file per container × duration."""
+    fixtures = []
+    for name, (ext, content_type, codec_args) in CONTAINERS.items():
+        for seconds in durations:
+            path = os.path.join(directory, f"{name}-{seconds}s.{ext}")
+            if not os.path.exists(path):
+                partial = os.path.join(directory, f".partial-{os.path.basename(path)}")
+                await _make_fixture(partial, seconds, codec_args)
+                os.replace(partial, path)   # an interrupted run never leaves a truncated fixture to reuse
+            fixtures.append(Fixture(f"{name}-{seconds}s", path, content_type, seconds))
+    return fixtures
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _tree_rss(root: int) -> int:
+    """Resident bytes of ``root`` and all its descendants."""
+    children: dict[int, list[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    total, stack = 0, [root]
+    while stack:
+        pid = stack.pop()
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * _PAGE_SIZE
+        except (OSError, ValueError, IndexError):
+            pass
+        stack.extend(children.get(pid, []))
+    return total
+
+
+def _cpu_seconds(pid: int) -> float:
+    """utime + stime of ``pid`` plus those of its children it has already reaped."""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return sum(int(v) for v in fields[11:15]) / _CLK_TCK
+
+
+class _RssSampler(threading.Thread):
+    def __init__(self, pid: int, interval: float = 0.1) -> None:
+        super().__init__(daemon=True)
+        self.pid, self.interval, self.peak = pid, interval, 0
+        self._finished = threading.Event()
+
+    def run(self) -> None:
+        while not self._finished.wait(self.interval):
+            self.peak = max(self.peak, _tree_rss(self.pid))
+
+    def stop(self) -> int:
+        self._finished.set()
+        self.join()
+        return self.peak
+
+
+def _start_server(port: int, temp_dir: str) -> subprocess.Popen:
+    env = {**os.environ, "TEMP_DIR": temp_dir}
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+
+
+async def _wait_healthy(client: httpx.AsyncClient, server: subprocess.Popen) -> None:
+    for _ in range(300):
+        if server.poll() is not None:
+            raise SystemExit(f"server exited with {server.returncode}")
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise SystemExit("server did not become healthy")
+
+
+async def _submit(client: httpx.AsyncClient, kind: str, fixture: Fixture, n: int) -> tuple[str, int]:
+    """POST one job, waiting out 429s; returns (job_id, retries)."""
+    retries = 0
+    while True:
+        if kind == "upload":
+            with open(fixture.path, "rb") as f:
+                res = await client.post(
+                    "/extract/upload", headers=HEADERS,
+                    files={"file": (os.path.basename(fixture.path), f, fixture.content_type)},
+                )
+        else:
+            # A distinct URL per job, so identical requests don't coalesce into one extraction
+            res = await client.post("/extract/youtube", headers=HEADERS, json={"url": f"{fixture.page}?n={n}"})
+        if res.status_code != 429:
+            res.raise_for_status()
+            return res.json()["job_id"], retries
+        retries += 1
+        await asyncio.sleep(min(float(res.headers.get("retry-after", 1)), 5.0))
+
+
+async def _one_job(client: httpx.AsyncClient, kind: str, fixture: Fixture, n: int) -> dict:
+    t0 = time.perf_counter()
+    job_id, retries = await _submit(client, kind, fixture, n)
+    job = {"status": "unknown"}
+    async with client.stream("GET", f"/jobs/{job_id}/events") as events:
+        async for line in events.aiter_lines():
+            if line.startswith("data: ") and (job := json.loads(line[6:]))["status"] in TERMINAL:
+                break
+    size = 0
+    if job["status"] == "done":
+        size = len((await client.get(job["audio_url"])).content)
+    return {
+        "fixture": fixture.name,
+        "status": job["status"],
+        "error": job.get("error"),
+        "latency": time.perf_counter() - t0,
+        "audio_seconds": job.get("duration") or 0.0,
+        "bytes": size,
+        "retries": retries,
+    }
+
+
+def _percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+async def _run_path(kind: str, fixtures: list[Fixture], jobs: int, concurrency: int) -> dict:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        port = _free_port()
+        server = _start_server(port, temp_dir)
+        try:
+            timeout = httpx.Timeout(600.0, connect=10.0)
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=timeout) as client:
+                await _wait_healthy(client, server)
+                # One untimed job per fixture pays first-use costs (imports, page cache)
+                for i, fixture in enumerate(fixtures):
+                    await _one_job(client, kind, fixture, -1 - i)
+
+                sampler = _RssSampler(server.pid)
+                sampler.start()
+                cpu0, t0 = _cpu_seconds(server.pid), time.perf_counter()
+                pending = iter(range(jobs))
+
+                async def client_loop() -> list[dict]:
+                    done = []
+                    for n in pending:
+                        done.append(await _one_job(client, kind, fixtures[n % len(fixtures)], n))
+                    return done
+
+                batches = await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+                wall = time.perf_counter() - t0
+                cpu = _cpu_seconds(server.pid) - cpu0
+                peak_rss = sampler.stop()
+        finally:
+            server.send_signal(signal.SIGTERM)
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+                server.wait()
+
+    results = [r for batch in batches for r in batch]
+    ok = [r for r in results if r["status"] == "done"]
+    latencies = [r["latency"] for r in ok] or [0.0]
+    audio_minutes = sum(r["audio_seconds"] for r in ok) / 60
+    return {
+        "jobs": len(results),
+        "ok": len(ok),
+        "failed": len(results) - len(ok),
+        "errors": sorted({r["error"] for r in results if r["error"]})[:5],
+        "retries_429": sum(r["retries"] for r in results),
+        "wall_seconds": round(wall, 3),
+        "jobs_per_second": round(len(ok) / wall, 3),
+        "latency_ms": {f"p{q}": round(_percentile(latencies, q) * 1000, 1) for q in (50, 95, 99)},
+        "latency_ms_by_fixture": {
+            name: round(statistics.median(r["latency"] for r in ok if r["fixture"] == name) * 1000, 1)
+            for name in dict.fromkeys(r["fixture"] for r in ok)
+        },
+        "peak_rss_mib": round(peak_rss / 2**20, 1),
+        "cpu_seconds": round(cpu, 3),
+        "audio_minutes": round(audio_minutes, 3),
+        "cpu_seconds_per_audio_minute": round(cpu / audio_minutes, 3) if audio_minutes else None,
+    }
+
+
+def _print_report(results: dict) -> None:
+    print(f"{'path':8} {'jobs':>5} {'ok':>5} {'jobs/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+          f" {'RSS MiB':>8} {'CPU s':>8} {'CPU s/audio min':>16}")
+    for kind, r in results.items():
+        lat = r["latency_ms"]
+        per_minute = r["cpu_seconds_per_audio_minute"]
+        print(f"{kind:8} {r['jobs']:5} {r['ok']:5} {r['jobs_per_second']:8.2f} {lat['p50']:9.1f} {lat['p95']:9.1f}"
+              f" {lat['p99']:9.1f} {r['peak_rss_mib']:8.1f} {r['cpu_seconds']:8.2f}"
+              f" {per_minute if per_minute is not None else float('nan'):16.3f}")
+    for kind, r in results.items():
+        by_fixture = "  ".join(f"{name} {ms:.0f}" for name, ms in r["latency_ms_by_fixture"].items())
+        print(f"{kind} median latency ms by fixture: {by_fixture}")
+        for error in r["errors"]:
+            print(f"{kind} error: {error[:200]}")
+
+
+async def main(args: argparse.Namespace) -> None:
+    durations = [int(d) for d in args.durations.split(",")]
+    with tempfile.TemporaryDirectory() as scratch:
+        media_dir = args.fixtures or scratch
+        os.makedirs(media_dir, exist_ok=True)
+        fixtures = await _fixtures(media_dir, durations)
+
+        server, port = serve(media_dir)
+        for fixture in fixtures:
+            fixture.page = write_page(
+                media_dir, port, os.path.basename(fixture.path), fixture.seconds, f"{fixture.name}.html",
+            )
+
+        print(f"{len(fixtures)} fixtures ({', '.join(CONTAINERS)} × {durations} s), "
+              f"{args.jobs} jobs per path, concurrency {args.concurrency}")
+        results = {}
+        for kind in args.paths.split(","):
+            results[kind] = await _run_path(kind, fixtures, args.jobs, args.concurrency)
+        server.shutdown()
+
+    _print_report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paths", default="upload,youtube", help="comma-separated: upload, youtube")
+    parser.add_argument("--jobs", type=int, default=40, help="timed jobs per path")
+    parser.add_argument("--concurrency", type=int, default=8, help="clients submitting in parallel")
+    parser.add_argument("--durations", default="30,120,600", help="fixture lengths in seconds")
+    parser.add_argument("--fixtures", help="directory to keep generated fixtures in between runs")
+    parser.add_argument("--json", help="also write the results here")
+    asyncio.run(main(parser.parse_args()))
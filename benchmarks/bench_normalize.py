@@ -0,0 +1,81 @@
+"""CPU-seconds per audio minute for each NORMALIZE_MODE on a local fixture.
+
+"gain (cached)" is a repeat job on the same source: the measurement comes from the
+loudness cache, so only the encode with a volume filter runs.
+
+Run from the project root (needs ffmpeg on PATH):
+    python benchmarks/bench_normalize.py --minutes 5 --runs 3
+"""
+import argparse
+import asyncio
+import os
+import resource
+import statistics
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("API_KEY", "bench")
+
+from config import settings  # noqa: E402
+from core import loudness  # noqa: E402
+from core.extractor import _clip_args, _resolve_bin, _transcode_cmd  # noqa: E402
+
+
+def _children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+async def _exec(cmd: list[str]) -> None:
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+    )
+    _, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise SystemExit(stderr.decode(errors="replace")[-2000:])
+
+
+async def _make_fixture(path: str, minutes: int) -> None:
+    # Pink noise under a tone: something for loudnorm's dynamics to actually work on
+    await _exec([
+        *_resolve_bin("ffmpeg"),
+        "-f", "lavfi", "-i", f"anoisesrc=color=pink:amplitude=0.05:duration={minutes * 60}",
+        "-f", "lavfi", "-i", f"sine=frequency=330:duration={minutes * 60}",
+        "-filter_complex", "amix=inputs=2", "-acodec", "aac", "-ab", "160k", "-y", path,
+    ])
+
+
+async def _run_mode(mode: str, source: str, out: Path) -> float:
+    settings.NORMALIZE_MODE = "gain" if mode.startswith("gain") else mode
+    cpu0 = _children_cpu()
+    measured = None
+    if mode == "gain":
+        measured = await loudness.measure(_resolve_bin("ffmpeg"), _clip_args(None), source)
+    elif mode == "gain (cached)":
+        measured = {"integrated": -23.0, "peak": -6.0}   # what the cache lookup would return
+    await _exec(_transcode_cmd(source, out, audio_filter=loudness.filter_args(measured)))
+    return _children_cpu() - cpu0
+
+
+async def main(minutes: int, runs: int) -> None:
+    settings.AUDIO_CLIP_SECONDS = 0   # normalise the whole fixture
+    settings.STREAM_OUTPUT = False
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "fixture.m4a")
+        await _make_fixture(source, minutes)
+        out = Path(tmp) / f"out.{settings.AUDIO_FORMAT}"
+
+        print(f"fixture: {minutes} min AAC → {settings.AUDIO_FORMAT} {settings.AUDIO_QUALITY}, {runs} runs")
+        for mode in ("off", "gain", "gain (cached)", "loudnorm"):
+            cpu = statistics.median([await _run_mode(mode, source, out) for _ in range(runs)])
+            print(f"{mode:14}: {cpu / minutes:7.3f} CPU-s per audio minute")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--minutes", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.minutes, args.runs))
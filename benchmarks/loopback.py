@@ -0,0 +1,72 @@
+"""Loopback stand-in for YouTube shared by the benchmarks.
+
+A threaded HTTP server (with single byte-range support) serves fixture media from a
+directory, next to one page per fixture whose JSON-LD metadata lets yt-dlp's generic
+extractor resolve it like a real video page — so the real yt-dlp runs, offline.
+"""
+import json
+import os
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+served = {"bytes": 0}
+
+
+class RangeHandler(SimpleHTTPRequestHandler):
+    """Static files with single byte-range support; counts body bytes sent in ``served``."""
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path) or "Range" not in self.headers:
+            self._remaining = None
+            return super().send_head()
+        size = os.path.getsize(path)
+        first, _, last = self.headers["Range"].removeprefix("bytes=").partition("-")
+        start = int(first) if first else max(0, size - int(last))
+        end = min(int(last), size - 1) if first and last else size - 1
+        f = open(path, "rb")
+        f.seek(start)
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        self._remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile) -> None:
+        remaining = self._remaining
+        while remaining is None or remaining > 0:
+            chunk = source.read(64 * 1024 if remaining is None else min(64 * 1024, remaining))
+            if not chunk:
+                break
+            try:
+                outputfile.write(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                break   # ffmpeg hangs up once it has the segment it seeked to
+            served["bytes"] += len(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+
+
+def serve(directory: str) -> tuple[ThreadingHTTPServer, int]:
+    """Start serving ``directory`` on an ephemeral loopback port; returns (server, port)."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), lambda *a: RangeHandler(*a, directory=directory))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_address[1]
+
+
+def write_page(directory: str, port: int, media_name: str, seconds: int, page_name: str = "index.html") -> str:
+    """A video page for ``media_name``; returns its URL."""
+    ld = {
+        "@context": "https://schema.org", "@type": "VideoObject", "name": media_name,
+        "contentUrl": f"http://127.0.0.1:{port}/{media_name}", "duration": f"PT{seconds}S",
+    }
+    with open(os.path.join(directory, page_name), "w") as f:
+        f.write(f'<html><head><script type="application/ld+json">{json.dumps(ld)}</script></head></html>')
+    return f"http://127.0.0.1:{port}/{page_name}"
@@ -10,9 +10,26 @@ class Settings(BaseSettings):
     AUDIO_FORMAT: str = "mp3"
     AUDIO_QUALITY: str = "128k"
     AUDIO_CLIP_SECONDS: int = 30        # 0 = no limit
+    NORMALIZE_MODE: str = "gain"        # off | gain (قياس سريع + volume) | loudnorm (أبطأ بكثير)
+    STREAM_COPY: bool = True            # نسخ الصوت دون إعادة ترميز إذا كان بصيغة AUDIO_FORMAT أصلاً
+    CLIP_FETCH: bool = False            # المقاطع: ffmpeg يجلب الجزء المطلوب فقط عبر HTTP Range
+    STREAM_OUTPUT: bool = False         # /download يبث الصوت أثناء الترميز قبل انتهاء الوظيفة
+    PREFLIGHT: bool = True              # جلب بيانات الفيديو قبل الطابور: رفض فوري (422) وإرجاع العنوان
+    INFO_CACHE_TTL_SECONDS: int = 1800  # صلاحية بيانات الفيديو المخزنة في TEMP_DIR/info
     COOKIES_FILE: str = ""              # مسار ملف cookies.txt (Netscape format) — set via /admin/cookies
     COOKIES_BASE64: str = ""            # cookies.txt base64 — deprecated, use /admin/cookies instead
     PROXY: str = ""                     # proxy URL e.g. socks5://host:port
+    WORKERS: int = 1                    # عدد عمليات uvicorn — أكثر من 1 يفرض JOB_STORE=sqlite
+    JOB_STORE: str = "memory"           # memory | sqlite (يبقى بعد إعادة التشغيل)
+    JOB_STORE_PATH: str = ""            # ملف SQLite — الافتراضي TEMP_DIR/jobs.db
+    YOUTUBE_CONCURRENCY: int = 2        # تنزيلات yt-dlp المتزامنة
+    YTDLP_ENGINE: str = "subprocess"    # subprocess | pool (YoutubeDL داخل عمليات مُسخّنة مسبقاً)
+    YTDLP_POOL_SIZE: int = 0            # 0 = YOUTUBE_CONCURRENCY
+    TRANSCODE_CONCURRENCY: int = 2      # عمليات ffmpeg المحلية المتزامنة
+    QUEUE_MAX_SIZE: int = 100           # أقصى عدد وظائف منتظرة قبل الرد بـ 429
+    BATCH_MAX_ITEMS: int = 50           # أقصى عدد روابط في طلب /extract/youtube/batch
+    RESULT_CACHE_MAX_MB: int = 1024     # كاش النتائج في TEMP_DIR/cache — 0 = disabled
+    STORAGE_QUOTA_MB: int = 0           # حد مساحة TEMP_DIR كاملة — 0 = no limit
 
     model_config = {"env_file": ".env"}
 
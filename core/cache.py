@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+from config import settings
+
+
+_VIDEO_ID_RE = re.compile(r"^[A-Za-z0-9_-]{11}$")
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+
+def canonical_video_id(url: str) -> Optional[str]:
+    """Return the 11-char YouTube video ID for any common URL shape, else None."""
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+
+    candidate = None
+    if host == "youtu.be":
+        candidate = parsed.path.strip("/").split("/")[0]
+    elif host.endswith(("youtube.com", "youtube-nocookie.com")):
+        if parsed.path == "/watch":
+            candidate = parse_qs(parsed.query).get("v", [None])[0]
+        else:
+            parts = parsed.path.strip("/").split("/")
+            if len(parts) >= 2 and parts[0] in ("shorts", "embed", "live", "v"):
+                candidate = parts[1]
+
+    if candidate and _VIDEO_ID_RE.match(candidate):
+        return candidate
+    return None
+
+
+def cache_key(*parts) -> str:
+    """Stable content-address for a result: hash of everything that shapes the output."""
+    raw = "|".join(str(p) for p in parts)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def youtube_cache_key(video_id: str, window) -> str:
+    return cache_key(
+        "youtube", video_id, window, settings.AUDIO_FORMAT, settings.AUDIO_QUALITY,
+        settings.NORMALIZE_MODE, settings.STREAM_COPY,
+    )
+
+
+def _cache_dir() -> Path:
+    return Path(settings.TEMP_DIR) / "cache"
+
+
+def _enabled() -> bool:
+    return settings.RESULT_CACHE_MAX_MB > 0
+
+
+def link_or_copy(src: Path, dest: Path) -> None:
+    if dest.exists():
+        dest.unlink()
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+
+def lookup(key: str) -> Optional[dict]:
+    """Return the cached entry's metadata (with its ``path``) or None on a miss."""
+    if not _enabled():
+        return None
+    meta_path = _cache_dir() / f"{key}.json"
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        path = _cache_dir() / meta["file"]
+        os.utime(path)          # mtime doubles as the LRU timestamp
+    except (OSError, ValueError, KeyError):
+        _stats["misses"] += 1
+        return None
+    _stats["hits"] += 1
+    meta["path"] = path
+    return meta
+
+
+def store(key: str, src: Path, **meta) -> None:
+    """Add a finished result to the cache. Failures are non-fatal: the job already succeeded."""
+    if not _enabled():
+        return
+    try:
+        os.makedirs(_cache_dir(), exist_ok=True)
+        filename = f"{key}{src.suffix}"
+        link_or_copy(src, _cache_dir() / filename)
+        with open(_cache_dir() / f"{key}.json", "w", encoding="utf-8") as f:
+            json.dump({**meta, "file": filename}, f)
+        _stats["stores"] += 1
+    except OSError:
+        return
+    evict()
+
+
+def materialize(entry: dict, dest: Path) -> None:
+    """Expose a cached file under a job's own path (hard link, so job cleanup can't hurt the cache)."""
+    link_or_copy(entry["path"], dest)
+
+
+def entries() -> list[tuple[Path, os.stat_result]]:
+    try:
+        paths = [p for p in _cache_dir().iterdir() if p.suffix != ".json"]
+    except FileNotFoundError:
+        return []
+    found = []
+    for p in paths:
+        try:
+            found.append((p, p.stat()))
+        except FileNotFoundError:
+            continue
+    return found
+
+
+def remove(path: Path) -> None:
+    """Drop one cache entry (audio file and its metadata sidecar)."""
+    for p in (path, path.with_suffix(".json")):
+        try:
+            p.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def evict() -> int:
+    """Drop least-recently-used entries until the cache fits RESULT_CACHE_MAX_MB."""
+    max_bytes = settings.RESULT_CACHE_MAX_MB * 1024 * 1024
+    current = entries()
+    total = sum(st.st_size for _, st in current)
+    removed = 0
+    for path, st in sorted(current, key=lambda e: e[1].st_mtime):
+        if total <= max_bytes:
+            break
+        remove(path)
+        total -= st.st_size
+        removed += 1
+    _stats["evictions"] += removed
+    return removed
+
+
+def stats() -> dict:
+    current = entries()
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "hit_ratio": round(_stats["hits"] / lookups, 3) if lookups else None,
+        "entries": len(current),
+        "bytes": sum(st.st_size for _, st in current),
+        "max_bytes": settings.RESULT_CACHE_MAX_MB * 1024 * 1024,
+    }
@@ -1,18 +1,76 @@
 import asyncio
 import os
+import re
 import time
 from config import settings
-from core.job_store import get_all_jobs, delete_job
+from core import cache, loudness, video_info
+from core.job_store import get_job, oldest_job_created_at, pop_expired_jobs
+
+_JOB_FILE_RE = re.compile(r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})[._]")
+_SLACK_SECONDS = 0.1  # wake just after the deadline so the strict `<` in pop_expired matches
+
+
+def job_files(job: dict) -> list[str]:
+    """Every result file a job owns: its file_path plus any extra renditions."""
+    paths = [job.get("file_path"), *(job.get("renditions") or {}).values()]
+    return list(dict.fromkeys(p for p in paths if p))
+
+
+def _remove_files(paths: list[str]) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def remove_job_files(job_id: str) -> int:
+    """Delete everything in TEMP_DIR belonging to one job: results, sources, partial downloads."""
+    removed = 0
+    try:
+        entries = list(os.scandir(settings.TEMP_DIR))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        match = _JOB_FILE_RE.match(entry.name)
+        if entry.is_file() and match and match.group(1) == job_id:
+            _remove_files([entry.path])
+            removed += 1
+    return removed
+
+
+def reconcile_orphans() -> int:
+    """Delete job files in TEMP_DIR whose job no longer exists (e.g. lost in a restart)."""
+    removed = 0
+    try:
+        entries = list(os.scandir(settings.TEMP_DIR))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        match = _JOB_FILE_RE.match(entry.name)
+        if entry.is_file() and match and get_job(match.group(1)) is None:
+            _remove_files([entry.path])
+            removed += 1
+    return removed
 
 
 async def cleanup_loop() -> None:
-    """يعمل كل 10 دقائق، يحذف الوظائف المنتهية الصلاحية"""
+    """ينام حتى أقرب موعد انتهاء صلاحية ثم يحذف الوظائف المنتهية وملفاتها.
+
+    Deadlines come from the job store's created_at index (heap / SQLite index), so each
+    wake-up costs O(log n) and a job is removed within ~_SLACK_SECONDS of its TTL.
+    """
+    await asyncio.to_thread(reconcile_orphans)
     while True:
-        await asyncio.sleep(600)
-        now = time.time()
-        for job_id, job in list(get_all_jobs().items()):
-            if now - job["created_at"] > settings.JOB_TTL_SECONDS:
-                file_path = job.get("file_path")
-                if file_path and os.path.exists(file_path):
-                    os.remove(file_path)
-                delete_job(job_id)
+        oldest = oldest_job_created_at()
+        # Any job created later expires later, so an empty store can sleep a full TTL
+        deadline = time.time() + settings.JOB_TTL_SECONDS if oldest is None else oldest + settings.JOB_TTL_SECONDS
+        await asyncio.sleep(max(deadline - time.time(), 0) + _SLACK_SECONDS)
+
+        expired = pop_expired_jobs(time.time() - settings.JOB_TTL_SECONDS)
+        paths = [p for _, job in expired for p in job_files(job)]
+        if paths:
+            await asyncio.to_thread(_remove_files, paths)
+        await asyncio.to_thread(cache.evict)
+        await asyncio.to_thread(loudness.prune)
+        await asyncio.to_thread(video_info.prune)
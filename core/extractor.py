@@ -1,15 +1,53 @@
 import os
+import re
+import json
 import sys
+import time
 import shutil
 import asyncio
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import AsyncIterator, Callable
 from config import settings
+from core import cache, locks, loudness, metrics, procs, storage, video_info, ytdlp_pool
 from core.job_store import update_job
 from models import JobStatus
 
 
 _PYTHON_PACKAGES = {"yt-dlp": "yt_dlp"}
 
+_META_PREFIX = "E2A|"
+_PROGRESS_PREFIX = "E2A|progress|"
+_PROGRESS_INTERVAL = 0.5
+_FFMPEG_DURATION_RE = re.compile(r"Duration:\s*(\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+_FFMPEG_TIME_RE = re.compile(r"time=\s*(\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+
+# AUDIO_FORMAT -> (ffmpeg encoder, source codecs that can be stream-copied into it as-is)
+_CODECS = {
+    "mp3":  ("libmp3lame", {"mp3"}),
+    "m4a":  ("aac",        {"aac"}),
+    "aac":  ("aac",        {"aac"}),
+    "opus": ("libopus",    {"opus"}),
+    "ogg":  ("libvorbis",  {"vorbis"}),
+    "flac": ("flac",       {"flac"}),
+}
+# libopus only encodes at 48/24/16/12/8 kHz
+_SAMPLE_RATES = {"opus": "48000"}
+# yt-dlp format selectors preferring a source already in the target codec (so -x just remuxes)
+_YTDLP_FORMATS = {
+    "m4a":  "bestaudio[acodec^=mp4a]/bestaudio/best",
+    "aac":  "bestaudio[acodec^=mp4a]/bestaudio/best",
+    "opus": "bestaudio[acodec=opus]/bestaudio/best",
+    "ogg":  "bestaudio[acodec=vorbis]/bestaudio/best",
+}
+
+# Single-flight: canonical key -> job ids waiting on the extraction already running for it
+_inflight: dict[str, list[str]] = {}
+# Pre-flight metadata runs: (video id or URL, format selector) -> the run its requests share
+_preflights: dict[tuple[str, str], asyncio.Task] = {}
+_preflight_slots = asyncio.Semaphore(8)
+_PREFLIGHT_TIMEOUT = 20
+
 
 def _resolve_bin(name: str) -> list[str]:
     """Find binary: python -m for Python packages, PATH for system binaries."""
@@ -21,122 +59,864 @@ def _resolve_bin(name: str) -> list[str]:
     raise FileNotFoundError(f"'{name}' not found. Install it or add to PATH.")
 
 
-async def extract_youtube(job_id: str, url: str, start_sec=None, end_sec=None) -> None:
-    """يُشغَّل كـ background task"""
-    output_path = Path(settings.TEMP_DIR) / f"{job_id}.%(ext)s"
+def _clip_window(start_sec=None, end_sec=None) -> tuple | None:
+    """The (start, end) section to download, or None for the whole video."""
+    clip = settings.AUDIO_CLIP_SECONDS
+    if start_sec is not None or end_sec is not None:
+        s = start_sec or 0
+        e = end_sec or "inf"
+        if clip and e == "inf":
+            e = s + clip
+        elif clip and isinstance(e, (int, float)):
+            e = min(e, s + clip)
+        return (s, e)
+    if clip:
+        return (0, clip)
+    return None
+
+
+def _window_seconds(window) -> float | None:
+    if window and isinstance(window[1], (int, float)):
+        return window[1] - window[0]
+    return None
+
+
+def _youtube_keys(url: str, window, renditions=None) -> tuple[str | None, str]:
+    """(result-cache key or None, single-flight key). Only single-file YouTube results are
+    cached; multi-rendition jobs still coalesce with identical in-flight requests."""
+    video_id = cache.canonical_video_id(url)
+    key = cache.youtube_cache_key(video_id, window) if video_id and not renditions else None
+    flight_key = key or cache.cache_key(
+        "url", video_id or url, window, settings.AUDIO_FORMAT, settings.AUDIO_QUALITY,
+        settings.NORMALIZE_MODE, _rendition_specs(renditions),
+    )
+    return key, flight_key
+
+
+def youtube_flight_key(url: str, start_sec=None, end_sec=None, renditions=None) -> str:
+    """Identity of a YouTube request: equal keys produce the same audio."""
+    return _youtube_keys(url, _clip_window(start_sec, end_sec), renditions)[1]
+
+
+def _rendition_specs(renditions) -> list[tuple[str, str, str]]:
+    """(name, format, bitrate) per requested rendition, defaults filled from AUDIO_FORMAT/AUDIO_QUALITY."""
+    return [
+        (r["name"], r.get("format") or settings.AUDIO_FORMAT, r.get("bitrate") or settings.AUDIO_QUALITY)
+        for r in renditions or []
+    ]
+
+
+def _output_paths(job_id: str, renditions) -> dict[str | None, Path]:
+    """Where a job's results go: ``{None: path}`` for the single default output,
+    else one ``{job_id}.{name}.{format}`` per rendition (the first is the job's file_path)."""
+    if not renditions:
+        return {None: Path(settings.TEMP_DIR) / f"{job_id}.{settings.AUDIO_FORMAT}"}
+    return {
+        name: Path(settings.TEMP_DIR) / f"{job_id}.{name}.{fmt}"
+        for name, fmt, _ in _rendition_specs(renditions)
+    }
+
+
+def _done_fields(outputs: dict[str | None, Path]) -> dict:
+    fields = {"file_path": str(next(iter(outputs.values())))}
+    if None not in outputs:
+        fields["renditions"] = {name: str(path) for name, path in outputs.items()}
+    return fields
+
+
+def attach_youtube(job_id: str, url: str, start_sec=None, end_sec=None, renditions=None) -> bool:
+    """Settle a job without a worker slot — from the result cache, or by joining an
+    identical extraction already in flight. Returns False if a real download is needed."""
+    final_path = Path(settings.TEMP_DIR) / f"{job_id}.{settings.AUDIO_FORMAT}"
+    key, flight_key = _youtube_keys(url, _clip_window(start_sec, end_sec), renditions)
+    if key and (entry := cache.lookup(key)):
+        try:
+            cache.materialize(entry, final_path)
+            update_job(
+                job_id,
+                status=JobStatus.done,
+                file_path=str(final_path),
+                title=entry.get("title"),
+                duration=entry.get("duration"),
+            )
+            return True
+        except OSError:
+            pass  # entry evicted between lookup and link — fall through to a fresh download
+
+    if flight_key in _inflight:
+        # An identical extraction is already running: the leader finishes this job too
+        update_job(job_id, status=JobStatus.processing)
+        _inflight[flight_key].append(job_id)
+        return True
+    return False
+
+
+def detach_follower(job_id: str) -> bool:
+    """Stop a job coalesced into another one's extraction from receiving its result."""
+    for followers in _inflight.values():
+        if job_id in followers:
+            followers.remove(job_id)
+            return True
+    return False
+
+
+def _cookies_file() -> str | None:
+    """COOKIES_FILE, or the file /admin/cookies wrote — which another worker process may have handled."""
+    for path in (settings.COOKIES_FILE, os.path.join(settings.TEMP_DIR, "cookies.txt")):
+        if path and os.path.exists(path):
+            return path
+    return None
+
+
+@asynccontextmanager
+async def _host_flight(flight_key: str) -> AsyncIterator[None]:
+    """Extend single-flight across worker processes: one download per key on the whole host."""
+    if settings.WORKERS <= 1:
+        yield
+        return
+    async with locks.file_lock(os.path.join(settings.TEMP_DIR, "flights", f"{flight_key}.lock")):
+        yield
+
+
+async def preflight(url: str) -> dict | None:
+    """PREFLIGHT: the video's yt-dlp info, resolved before the job is queued and cached for
+    INFO_CACHE_TTL_SECONDS, which the download then reuses. Raises VideoRejected if the
+    video can't be extracted or breaks the duration / size limits; None if yt-dlp didn't
+    answer within _PREFLIGHT_TIMEOUT (the job then runs and is judged as before)."""
+    selector = _ytdlp_format()
+    info = video_info.load(video_info.lookup(url, selector))
+    if info is None:
+        flight = (cache.canonical_video_id(url) or url, selector)
+        task = _preflights.get(flight)
+        if task is None:
+            task = _preflights[flight] = asyncio.ensure_future(_resolve_info(url, selector))
+            task.add_done_callback(lambda _: _preflights.pop(flight, None))
+        # shielded: one client going away doesn't cancel the run other requests are waiting on
+        info = await asyncio.shield(task)
+    if info is not None:
+        video_info.check_limits(info)
+    return info
+
+
+async def _resolve_info(url: str, selector: str) -> dict | None:
+    args = ["--dump-single-json", "--no-playlist", "--format", selector, "--remote-components", "ejs:github"]
+    if cookies := _cookies_file():
+        args += ["--cookies", cookies]
+    if settings.PROXY:
+        args += ["--proxy", settings.PROXY]
+    async with _preflight_slots:
+        proc = await procs.spawn(
+            *_resolve_bin("yt-dlp"), *args, url,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await procs.communicate(proc, timeout=_PREFLIGHT_TIMEOUT)
+        except asyncio.TimeoutError:
+            return None
+    if proc.returncode != 0:
+        errors = [line for line in stderr.decode("utf-8", errors="replace").splitlines() if line.startswith("ERROR:")]
+        raise video_info.VideoRejected((errors[-1] if errors else "yt-dlp could not resolve this video")[:500])
+    info = json.loads(stdout)
+    await asyncio.to_thread(video_info.store, url, selector, stdout)
+    return info
+
+
+async def extract_youtube(job_id: str, url: str, start_sec=None, end_sec=None, renditions=None) -> None:
+    """يُشغَّل من طابور المهام (core.scheduler)"""
+    outputs = _output_paths(job_id, renditions)
+    final_path = next(iter(outputs.values()))
     os.makedirs(settings.TEMP_DIR, exist_ok=True)
+    if attach_youtube(job_id, url, start_sec, end_sec, renditions):
+        return
     update_job(job_id, status=JobStatus.processing)
 
-    cmd = [
-        *_resolve_bin("yt-dlp"),
-        "--extract-audio",
-        "--audio-format", settings.AUDIO_FORMAT,
-        "--audio-quality", settings.AUDIO_QUALITY,
+    window = _clip_window(start_sec, end_sec)
+    key, flight_key = _youtube_keys(url, window, renditions)
+    followers: list[str] = []
+    _inflight[flight_key] = followers
+
+    try:
+        # Source download + encoded result(s) land in TEMP_DIR before the source is removed
+        expected = storage.expected_output_bytes(_window_seconds(window))
+        storage.reserve(job_id, (1 + len(outputs)) * expected)
+        async with _host_flight(flight_key):
+            # With several worker processes, a sibling may have finished this key while we waited
+            entry = cache.lookup(key) if key and settings.WORKERS > 1 else None
+            if entry:
+                cache.materialize(entry, final_path)
+                title, duration = entry.get("title"), entry.get("duration")
+            else:
+                title, duration = await _download_youtube(job_id, url, window, final_path, renditions)
+                if key:
+                    cache.store(key, final_path, title=title, duration=duration)
+
+        update_job(
+            job_id,
+            status=JobStatus.done,
+            **_done_fields(outputs),
+            title=title,
+            duration=duration,
+            progress=100.0,
+        )
+        _finish_followers(followers, job_id, outputs, title=title, duration=duration)
+    except Exception as e:
+        for jid in (job_id, *followers):
+            update_job(jid, status=JobStatus.failed, error=str(e), error_class=type(e).__name__)
+    except asyncio.CancelledError:
+        for jid in followers:
+            update_job(jid, status=JobStatus.failed, error="the extraction this job joined was cancelled")
+        raise
+    finally:
+        _inflight.pop(flight_key, None)
+        storage.release(job_id)
+
+
+def _ytdlp_args(job_id: str, url: str, window, output: str = "audio") -> list[str]:
+    """yt-dlp command-line options for one job — shared by both engines.
+
+    ``output``: ``audio`` has yt-dlp extract the final AUDIO_FORMAT file itself; ``source``
+    keeps the raw best audio stream as ``{job_id}_input.*`` for our own encode stage;
+    ``stdout`` writes that stream to stdout for an ffmpeg to encode as it arrives (yt-dlp
+    then logs, including --print and progress, to stderr).
+    """
+    if output == "stdout":
+        args = ["--format", _ytdlp_format(), "--output", "-"]
+    elif output == "source":
+        args = ["--format", _ytdlp_format(), "--output", str(Path(settings.TEMP_DIR) / f"{job_id}_input.%(ext)s")]
+    else:
+        args = [
+            "--format", _ytdlp_format(),
+            "--extract-audio",
+            "--audio-format", settings.AUDIO_FORMAT,
+            "--audio-quality", settings.AUDIO_QUALITY,
+            "--output", str(Path(settings.TEMP_DIR) / f"{job_id}.%(ext)s"),
+        ]
+    args += [
         "--max-filesize", f"{settings.MAX_FILE_SIZE_MB}m",
         "--match-filter", f"duration <= {settings.MAX_DURATION_SECONDS}",
         "--no-playlist",
-        "--output", str(output_path),
-        "--print", "title",
+        "--print", f"{_META_PREFIX}title|%(title)s",
+        # stage marks for metrics: extraction finished / download finished (before post-processing)
+        "--print", f"before_dl:{_META_PREFIX}stage|resolved",
+        "--print", f"post_process:{_META_PREFIX}stage|downloaded",
+        # after the audio is extracted; yt-dlp reports the section length for clipped downloads
+        "--print", f"after_move:{_META_PREFIX}duration|%(duration)s",
+        "--print", f"after_move:{_META_PREFIX}filepath|%(filepath)s",
         "--no-simulate",          # --print implies --simulate by default; override it
+        "--progress", "--newline",  # --print implies --quiet; keep one progress line per update
+        "--progress-template", f"download:{_PROGRESS_PREFIX}"
+        "%(progress.downloaded_bytes)s|%(progress.total_bytes,progress.total_bytes_estimate)s|%(progress.eta)s",
         "--remote-components", "ejs:github",
     ]
 
-    if settings.COOKIES_FILE and os.path.exists(settings.COOKIES_FILE):
-        cmd += ["--cookies", settings.COOKIES_FILE]
+    if cookies := _cookies_file():
+        args += ["--cookies", cookies]
     if settings.PROXY:
-        cmd += ["--proxy", settings.PROXY]
+        args += ["--proxy", settings.PROXY]
 
-    cmd.append(str(url))
+    if info_path := video_info.lookup(url, _ytdlp_format()):
+        args += ["--load-info-json", str(info_path)]   # resolved by the pre-flight: don't extract twice
+    else:
+        args.append(str(url))
 
-    clip = settings.AUDIO_CLIP_SECONDS
-    if start_sec is not None or end_sec is not None:
-        s = start_sec or 0
-        e = end_sec or "inf"
-        if clip and e == "inf":
-            e = s + clip
-        elif clip and isinstance(e, (int, float)):
-            e = min(e, s + clip)
-        cmd += ["--download-sections", f"*{s}-{e}"]
-    elif clip:
-        cmd += ["--download-sections", f"*0-{clip}"]
+    if window:
+        args += ["--download-sections", f"*{window[0]}-{window[1]}"]
+    return args
+
+
+async def _download_youtube(
+    job_id: str, url: str, window, final_path: Path, renditions=None,
+) -> tuple[str, float | None]:
+    """Run yt-dlp for one job with the configured engine; returns (title, duration).
+    With ``renditions``, all of them are encoded from one decode of the fetched source."""
+    loudness_key = cache.cache_key("loudness", _youtube_keys(url, window)[1])
+    if renditions:
+        meta = await _fetch_and_encode(job_id, url, window, final_path, loudness_key, renditions)
+    elif window and settings.CLIP_FETCH and _clip_fetch_supported():
+        meta = await _clip_fetch(job_id, url, window, final_path, loudness_key)
+    elif settings.STREAM_OUTPUT:
+        args = _ytdlp_args(job_id, url, window, output="stdout")
+        meta = await _stream_youtube(job_id, args, final_path, loudness_key)
+    elif not loudness.enabled():
+        meta = await _run_ytdlp(job_id, _ytdlp_args(job_id, url, window))
+        metrics.mark(job_id, "encoded")   # yt-dlp's own post-processor did the encode
+    else:
+        # Normalising needs the decoded source, so fetch it as-is and run our own encode stage
+        meta = await _fetch_and_encode(job_id, url, window, final_path, loudness_key)
 
+    if not final_path.exists():
+        raise RuntimeError("لم يُنتج yt-dlp ملفاً صوتياً (تجاوز حد المدة أو الحجم؟)")
+    title = meta.get("title") or "unknown"
+    duration = _to_seconds(meta.get("duration"))
+    if duration is None:
+        duration = await _get_duration(final_path)   # only when yt-dlp couldn't tell us
+        metrics.mark(job_id, "probed")
+    return title, duration
+
+
+async def _fetch_and_encode(
+    job_id: str, url: str, window, final_path: Path, loudness_key: str, renditions=None,
+) -> dict[str, str]:
+    """yt-dlp keeps the raw source, then our encode stage produces the result(s) from it."""
+    meta = await _run_ytdlp(job_id, _ytdlp_args(job_id, url, window, output="source"))
+    metrics.mark(job_id, "downloaded")
+    source = meta.get("filepath")
+    if not source or not os.path.exists(source):
+        raise RuntimeError("لم يُنتج yt-dlp ملفاً صوتياً (تجاوز حد المدة أو الحجم؟)")
     try:
-        proc = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
-        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=300)
+        outputs = _output_paths(job_id, renditions) if renditions else {None: final_path}
+        seconds = await _encode(job_id, source, outputs, {}, loudness_key, renditions=renditions)
+        metrics.mark(job_id, "encoded")
+    finally:
+        os.remove(source)
+    if seconds is not None:
+        meta["duration"] = str(seconds)
+    return meta
 
-        if proc.returncode != 0:
-            raise RuntimeError(stderr.decode("utf-8", errors="replace")[:500])
 
-        final_path = Path(settings.TEMP_DIR) / f"{job_id}.{settings.AUDIO_FORMAT}"
-        # yt-dlp prints title first, then may print other lines — take first non-empty line
-        title = next(
-            (line for line in stdout.decode("utf-8", errors="replace").strip().splitlines() if line.strip()),
-            "unknown"
+async def _run_ytdlp(job_id: str, args: list[str]) -> dict[str, str]:
+    """One yt-dlp run with the configured engine; returns its --print metadata."""
+    if settings.YTDLP_ENGINE == "pool":
+        return await ytdlp_pool.download(job_id, args, update_job, timeout=300)
+    meta: dict[str, str] = {}
+    returncode, stderr = await _run([*_resolve_bin("yt-dlp"), *args], _ytdlp_line_handler(job_id, meta))
+    if returncode != 0:
+        raise RuntimeError(stderr.decode("utf-8", errors="replace")[:500])
+    return meta
+
+
+async def _encode(
+    job_id: str,
+    input_path: str,
+    outputs: dict[str | None, Path],
+    state: dict[str, float],
+    loudness_key: str | None,
+    on_stderr_line: Callable[[str], None] | None = None,
+    renditions=None,
+) -> float | None:
+    """Encode stage for a local source: remux if possible, else normalise and transcode —
+    into every rendition at once when there are several. Returns the output length in
+    seconds (None if ffmpeg didn't say)."""
+    output_path = next(iter(outputs.values()))
+    if renditions:
+        specs = {name: (fmt, bitrate) for name, fmt, bitrate in _rendition_specs(renditions)}
+        cmd = _transcode_cmd(
+            input_path, output_path, progress=True,
+            audio_filter=await _loudness_filter(input_path, loudness_key),
+            renditions=[(path, *specs[name]) for name, path in outputs.items()],
         )
+    else:
+        # One probe decides between a remux and a transcode; skipped when a copy is impossible anyway
+        copy = _copy_possible() and _can_copy(await _probe_audio_codec(input_path))
+        audio_filter = [] if copy else await _loudness_filter(input_path, loudness_key)
+        cmd = _transcode_cmd(input_path, output_path, progress=True, copy=copy, audio_filter=audio_filter)
+    returncode, stderr = await _run(cmd, _ffmpeg_progress_handler(job_id, state), on_stderr_line)
+    if returncode != 0:
+        raise RuntimeError(stderr.decode("utf-8", errors="replace")[-500:])
+    return round(state["out"], 3) if state.get("out") else _ffmpeg_output_seconds(stderr)
+
+
+async def _loudness_filter(input_path: str, key: str | None) -> list[str]:
+    """``-af`` for NORMALIZE_MODE; gain mode measures the source once and caches it under ``key``."""
+    measured = None
+    if loudness.needs_measurement():
+        measured = loudness.lookup(key)
+        if measured is None:
+            measured = await loudness.measure(_resolve_bin("ffmpeg"), _clip_args(None), input_path)
+            loudness.store(key, measured)
+    return loudness.filter_args(measured)
+
+
+def _ytdlp_format() -> str:
+    if settings.STREAM_COPY:
+        return _YTDLP_FORMATS.get(settings.AUDIO_FORMAT, "bestaudio/best")
+    return "bestaudio/best"
+
+
+def _codec_family(codec: str | None) -> str | None:
+    """Normalise yt-dlp (``mp4a.40.2``) and ffprobe (``aac``) codec names."""
+    if not codec:
+        return None
+    codec = codec.lower()
+    return "aac" if codec.startswith("mp4a") else codec.split(".")[0]
+
+
+def _copy_possible() -> bool:
+    # Normalisation has to decode the audio, so only an un-normalised result can be a remux
+    return settings.STREAM_COPY and not loudness.enabled()
+
+
+def _can_copy(source_codec: str | None) -> bool:
+    """True when the source audio is already what AUDIO_FORMAT holds, so it can be remuxed."""
+    copyable = _CODECS.get(settings.AUDIO_FORMAT, (None, set()))[1]
+    return _copy_possible() and _codec_family(source_codec) in copyable
+
+
+def _clip_fetch_supported() -> bool:
+    """ffmpeg fetches the media itself on this path: it can't use a cookies.txt or a SOCKS proxy."""
+    return not _cookies_file() and (not settings.PROXY or settings.PROXY.startswith(("http://", "https://")))
+
+
+async def _clip_fetch(job_id: str, url: str, window, final_path: Path, loudness_key: str) -> dict[str, str]:
+    """CLIP_FETCH: resolve the best audio-only format's URL, then let one ffmpeg seek into it.
+
+    ffmpeg reads the container index (mp4 moov / webm cues) and issues HTTP range requests for
+    just the clipped segment, trimming and encoding in the same pass — no source download, no
+    intermediate file and no second post-processing ffmpeg as with --download-sections.
+    """
+    info = video_info.load(video_info.lookup(url, _ytdlp_format()))
+    if info and info.get("url"):
+        # The pre-flight already resolved the selected format
+        meta = {
+            "title": info.get("title") or "unknown",
+            "url": info["url"],
+            "acodec": info.get("acodec") or "",
+            "headers": json.dumps(info.get("http_headers") or {}),
+        }
+    else:
+        meta = await _resolve_format_url(job_id, url)
+    if not meta.get("url"):
+        raise RuntimeError("لم يُنتج yt-dlp ملفاً صوتياً (تجاوز حد المدة أو الحجم؟)")
+    metrics.mark(job_id, "resolved")
+
+    input_args = []
+    if headers := json.loads(meta.get("headers") or "{}"):
+        input_args += ["-headers", "".join(f"{k}: {v}\r\n" for k, v in headers.items())]
+    if settings.PROXY:
+        input_args += ["-http_proxy", settings.PROXY]
+    copy = _can_copy(meta.get("acodec"))
+    cmd = _transcode_cmd(
+        meta["url"], final_path, progress=True, window=window, input_args=input_args, copy=copy,
+        # Measuring would fetch the segment twice: use a cached measurement or single-pass loudnorm
+        audio_filter=None if copy else loudness.filter_args(loudness.lookup(loudness_key)),
+    )
 
-        duration = await _get_duration(final_path)
+    state = {"total": _window_seconds(window) or 0.0}
+    update_job(job_id, **_partial(final_path))
+    returncode, stderr = await _run(cmd, _ffmpeg_progress_handler(job_id, state))
+    if returncode != 0:
+        raise RuntimeError(stderr.decode("utf-8", errors="replace")[-500:])
+    metrics.mark(job_id, "encoded")   # fetch and encode are one ffmpeg pass here
+    seconds = round(state["out"], 3) if state.get("out") else _ffmpeg_output_seconds(stderr)
+    if seconds is not None:
+        meta["duration"] = str(seconds)
+    return meta
 
+
+async def _resolve_format_url(job_id: str, url: str) -> dict[str, str]:
+    meta: dict[str, str] = {}
+    args = [
+        "--format", _ytdlp_format(),
+        "--match-filter", f"duration <= {settings.MAX_DURATION_SECONDS}",
+        "--no-playlist",
+        "--print", f"{_META_PREFIX}title|%(title)s",
+        "--print", f"{_META_PREFIX}url|%(url)s",
+        "--print", f"{_META_PREFIX}acodec|%(acodec)s",
+        "--print", f"{_META_PREFIX}headers|%(http_headers)j",
+        "--remote-components", "ejs:github",
+    ]
+    if settings.PROXY:
+        args += ["--proxy", settings.PROXY]
+    returncode, stderr = await _run([*_resolve_bin("yt-dlp"), *args, str(url)], _ytdlp_line_handler(job_id, meta))
+    if returncode != 0:
+        raise RuntimeError(stderr.decode("utf-8", errors="replace")[:500])
+    return meta
+
+
+async def _stream_youtube(job_id: str, args: list[str], final_path: Path, loudness_key: str) -> dict[str, str]:
+    """STREAM_OUTPUT: yt-dlp stdout → pipe → ffmpeg, which encodes into final_path as bytes
+    arrive, so /download can follow the file (``partial_path``) before the job is done."""
+    meta: dict[str, str] = {}
+    errors: list[str] = []
+    handle = _ytdlp_line_handler(job_id, meta)
+
+    def on_ytdlp_line(line: str) -> None:
+        if line.startswith(_META_PREFIX):
+            handle(line)
+        else:
+            errors.append(line)
+
+    read_fd, write_fd = os.pipe()
+    children = []
+    try:
+        try:
+            children.append(await procs.spawn(
+                *_resolve_bin("yt-dlp"), *args, stdout=write_fd, stderr=asyncio.subprocess.PIPE,
+            ))
+            children.append(await procs.spawn(
+                *_transcode_cmd("pipe:0", final_path, audio_filter=loudness.filter_args(loudness.lookup(loudness_key))),
+                stdin=read_fd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+            ))
+        finally:
+            # The children hold their own copies; ours must go so ffmpeg sees EOF when yt-dlp exits
+            os.close(read_fd)
+            os.close(write_fd)
+        ytdlp, ffmpeg = children
+        update_job(job_id, partial_path=str(final_path))
+        ffmpeg_stderr = bytearray()
+        await asyncio.wait_for(asyncio.gather(
+            _pump(ytdlp.stderr, on_ytdlp_line),
+            _pump(ffmpeg.stderr, None, ffmpeg_stderr),
+            ytdlp.wait(),
+            ffmpeg.wait(),
+        ), timeout=300)
+    finally:
+        for proc in children:
+            await procs.reap(proc)
+
+    if ytdlp.returncode != 0:
+        raise RuntimeError("\n".join(errors)[-500:])
+    if ffmpeg.returncode != 0:
+        raise RuntimeError(ffmpeg_stderr.decode("utf-8", errors="replace")[-500:])
+    metrics.mark(job_id, "encoded")
+    # The clipped length comes from what ffmpeg wrote; yt-dlp only knows the whole video's
+    seconds = _ffmpeg_output_seconds(bytes(ffmpeg_stderr))
+    if seconds is not None:
+        meta["duration"] = str(seconds)
+    return meta
+
+
+def _ytdlp_line_handler(job_id: str, meta: dict[str, str]) -> Callable[[str], None]:
+    """Per-line callback for yt-dlp output: progress lines go to the job, --print lines into ``meta``."""
+    report = _progress_reporter(job_id)
+
+    def on_line(line: str) -> None:
+        if line.startswith(_PROGRESS_PREFIX):
+            done, total, eta = (line[len(_PROGRESS_PREFIX):].split("|") + ["", ""])[:3]
+            report(**ytdlp_pool.progress_fields({
+                "downloaded_bytes": _to_int(done), "total_bytes": _to_int(total), "eta": _to_int(eta),
+            }))
+        else:
+            parsed = _parse_ytdlp_meta(line)
+            if "stage" in parsed:
+                metrics.mark(job_id, parsed.pop("stage"))
+            meta.update(parsed)
+
+    return on_line
+
+
+def _parse_ytdlp_meta(stdout: bytes | str) -> dict[str, str]:
+    """Collect the ``E2A|key|value`` lines our --print templates emit."""
+    if isinstance(stdout, bytes):
+        stdout = stdout.decode("utf-8", errors="replace")
+    meta = {}
+    for line in stdout.splitlines():
+        if line.startswith(_META_PREFIX):
+            key, _, value = line[len(_META_PREFIX):].partition("|")
+            meta[key] = value.strip()
+    return meta
+
+
+def _to_seconds(value: str | None) -> float | None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None   # yt-dlp prints "NA" for unknown fields
+
+
+def _to_int(value: str) -> int | None:
+    try:
+        return int(float(value))
+    except ValueError:
+        return None
+
+
+def _progress_reporter(job_id: str) -> Callable[..., None]:
+    """update_job for progress fields, throttled — every call may be a SQLite write."""
+    last = [0.0]
+
+    def report(**fields) -> None:
+        now = time.monotonic()
+        if now - last[0] >= _PROGRESS_INTERVAL:
+            last[0] = now
+            update_job(job_id, **fields)
+
+    return report
+
+
+async def _pump(
+    stream: asyncio.StreamReader,
+    on_line: Callable[[str], None] | None,
+    sink: bytearray | None = None,
+) -> None:
+    async for raw in stream:
+        if sink is not None:
+            sink.extend(raw)
+        if on_line:
+            on_line(raw.decode("utf-8", errors="replace").rstrip("\r\n"))
+
+
+async def _run(
+    cmd: list[str],
+    on_line: Callable[[str], None],
+    on_stderr_line: Callable[[str], None] | None = None,
+    timeout: float = 300,
+) -> tuple[int, bytes]:
+    """Run a process, handing each output line to the callbacks as it arrives.
+    Returns (returncode, stderr); the process group is killed if it overruns ``timeout``
+    or the job is cancelled."""
+    proc = await procs.spawn(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stderr = bytearray()
+    try:
+        await asyncio.wait_for(asyncio.gather(
+            _pump(proc.stdout, on_line),
+            _pump(proc.stderr, on_stderr_line, stderr),
+            proc.wait(),
+        ), timeout)
+    finally:
+        await procs.reap(proc)
+    return proc.returncode, bytes(stderr)
+
+
+def _ffmpeg_output_seconds(stderr: bytes) -> float | None:
+    """Duration of what ffmpeg wrote, from the last ``time=HH:MM:SS.xx`` in its progress/stats output."""
+    matches = _FFMPEG_TIME_RE.findall(stderr.decode("utf-8", errors="replace"))
+    if not matches:
+        return None
+    h, m, sec = matches[-1]
+    return round(int(h) * 3600 + int(m) * 60 + float(sec), 3)
+
+
+def _finish_followers(
+    followers: list[str], leader_id: str, outputs: dict[str | None, Path], **result,
+) -> None:
+    """Give every coalesced job its own hard links to the leader's file(s) and mark it done."""
+    for jid in followers:
+        mine = {name: path.with_name(jid + path.name[len(leader_id):]) for name, path in outputs.items()}
+        try:
+            for name, path in outputs.items():
+                cache.link_or_copy(path, mine[name])
+        except OSError as e:
+            update_job(jid, status=JobStatus.failed, error=str(e))
+            continue
+        update_job(jid, status=JobStatus.done, **_done_fields(mine), **result)
+
+
+def _ffmpeg_progress_handler(job_id: str, state: dict[str, float]) -> Callable[[str], None]:
+    """Per-line callback for ``-progress pipe:1``; reports a percentage once ``state["total"]`` is known."""
+    report = _progress_reporter(job_id)
+
+    def on_line(line: str) -> None:
+        # key=value blocks; out_time_us is how far the output has got
+        key, _, value = line.partition("=")
+        if key == "out_time_us" and value.isdigit():
+            state["out"] = int(value) / 1e6
+            if state.get("total"):
+                report(progress=min(round(state["out"] / state["total"] * 100, 1), 100.0))
+
+    return on_line
+
+
+def _partial(output_path: Path) -> dict:
+    """Job fields that let /download follow ffmpeg's output while it is written (STREAM_OUTPUT)."""
+    return {"partial_path": str(output_path)} if settings.STREAM_OUTPUT else {}
+
+
+def _clip_args(window) -> list[str]:
+    """ffmpeg input options selecting the clip: ``window``, else the first AUDIO_CLIP_SECONDS."""
+    if window:
+        clip_args = ["-ss", str(window[0])]
+        if (seconds := _window_seconds(window)) is not None:
+            clip_args += ["-t", str(seconds)]
+        return clip_args
+    return ["-t", str(settings.AUDIO_CLIP_SECONDS)] if settings.AUDIO_CLIP_SECONDS else []
+
+
+def _transcode_cmd(
+    input_arg: str,
+    output_path: Path,
+    progress: bool = False,
+    window=None,
+    input_args: list[str] | None = None,
+    copy: bool = False,
+    audio_filter: list[str] | None = None,
+    renditions: list[tuple[Path, str, str]] | None = None,
+) -> list[str]:
+    """ffmpeg command turning a video (path, ``pipe:0`` or URL) into the target audio file.
+    With ``progress``, machine-readable progress goes to stdout instead of stats on stderr.
+    With ``copy``, the source audio track is remuxed untouched (no decode, filter or encode).
+    ``audio_filter`` defaults to the NORMALIZE_MODE filter usable without a measurement.
+    ``renditions`` — (path, format, bitrate) each — replaces ``output_path``: the audio is
+    decoded and filtered once, then asplit feeds one encoder per rendition.
+
+    The clip (``window``, else AUDIO_CLIP_SECONDS) is given as input options, so the demuxer
+    seeks and stops reading there — over HTTP that means range requests for just the segment.
+    """
+    clip_args = _clip_args(window)
+    progress_args = ["-progress", "pipe:1", "-nostats"] if progress else []
+    audio_filter = loudness.filter_args(None) if audio_filter is None else audio_filter
+    head = [*_resolve_bin("ffmpeg"), *progress_args, *(input_args or []), *clip_args, "-i", input_arg]
+
+    if renditions:
+        chain = f"{audio_filter[1]}," if audio_filter else ""
+        labels = "".join(f"[r{i}]" for i in range(len(renditions)))
+        cmd = [*head, "-filter_complex", f"[0:a]{chain}asplit={len(renditions)}{labels}", "-y"]
+        for i, (path, fmt, bitrate) in enumerate(renditions):
+            cmd += ["-map", f"[r{i}]", *_encoder_args(fmt, bitrate), *_stream_args(path), str(path)]
+        return cmd
+
+    if copy:
+        codec_args = ["-map", "0:a:0", "-c:a", "copy"]
+    else:
+        codec_args = [*audio_filter, *_encoder_args(settings.AUDIO_FORMAT, settings.AUDIO_QUALITY)]
+    return [*head, "-vn", *codec_args, *_stream_args(output_path), "-y", str(output_path)]
+
+
+def _encoder_args(fmt: str, bitrate: str) -> list[str]:
+    return [
+        "-acodec", _CODECS.get(fmt, _CODECS["mp3"])[0],
+        "-ab", bitrate,
+        "-ar", _SAMPLE_RATES.get(fmt, "44100"),
+    ]
+
+
+def _stream_args(output_path: Path) -> list[str]:
+    # A reader may be following the file: no Xing header rewritten at the end, no muxer buffering
+    if not settings.STREAM_OUTPUT:
+        return []
+    if output_path.suffix == ".mp3":
+        return ["-flush_packets", "1", "-write_xing", "0"]
+    if output_path.suffix == ".m4a":
+        return ["-flush_packets", "1", "-movflags", "+frag_keyframe+empty_moov"]
+    return ["-flush_packets", "1"]
+
+
+async def extract_video_file(job_id: str, input_path: str, renditions=None) -> None:
+    """تحويل ملف فيديو مرفوع إلى صوت"""
+    outputs = _output_paths(job_id, renditions)
+    output_path = next(iter(outputs.values()))
+    update_job(job_id, status=JobStatus.processing, **({} if renditions else _partial(output_path)))
+    state: dict[str, float] = {}
+
+    def on_stderr_line(line: str) -> None:
+        if "total" not in state and (m := _FFMPEG_DURATION_RE.search(line)):
+            total = int(m[1]) * 3600 + int(m[2]) * 60 + float(m[3])
+            clip = settings.AUDIO_CLIP_SECONDS
+            state["total"] = min(total, clip) if clip else total
+
+    try:
+        storage.reserve(job_id, len(outputs) * storage.expected_output_bytes(settings.AUDIO_CLIP_SECONDS))
+        loudness_key = None
+        if loudness.needs_measurement():
+            fingerprint = await asyncio.to_thread(loudness.file_fingerprint, input_path)
+            loudness_key = cache.cache_key("loudness", fingerprint, settings.AUDIO_CLIP_SECONDS)
+        duration = await _encode(
+            job_id, input_path, outputs, state, loudness_key, on_stderr_line, renditions=renditions,
+        )
+        metrics.mark(job_id, "encoded")
+        if duration is None:
+            duration = await _get_duration(output_path)
+            metrics.mark(job_id, "probed")
         update_job(
             job_id,
             status=JobStatus.done,
-            file_path=str(final_path),
-            title=title,
+            **_done_fields(outputs),
             duration=duration,
+            progress=100.0,
         )
     except Exception as e:
-        update_job(job_id, status=JobStatus.failed, error=str(e))
+        update_job(job_id, status=JobStatus.failed, error=str(e), error_class=type(e).__name__)
+    finally:
+        storage.release(job_id)
+        if os.path.exists(input_path):
+            os.remove(input_path)
 
 
-async def extract_video_file(job_id: str, input_path: str) -> None:
-    """تحويل ملف فيديو مرفوع إلى صوت"""
-    update_job(job_id, status=JobStatus.processing)
-    output_path = Path(settings.TEMP_DIR) / f"{job_id}.{settings.AUDIO_FORMAT}"
+class UploadTooLarge(Exception):
+    pass
 
-    clip_args = ["-t", str(settings.AUDIO_CLIP_SECONDS)] if settings.AUDIO_CLIP_SECONDS else []
-    cmd = [
-        *_resolve_bin("ffmpeg"), "-i", input_path,
-        *clip_args,
-        "-vn",
-        "-af", "loudnorm=I=-16:TP=-1.5:LRA=11",
-        "-acodec", "libmp3lame",
-        "-ab", settings.AUDIO_QUALITY,
-        "-ar", "44100",
-        "-y",
-        str(output_path),
-    ]
+
+async def extract_video_stream(job_id: str, chunks: AsyncIterator[bytes], max_bytes: int) -> None:
+    """Transcode while the upload is still arriving: request body → ffmpeg stdin, no _input file.
+
+    The container must be readable without seeking (webm, mkv, fragmented or faststart mp4).
+    Raises UploadTooLarge (job record left for the caller to drop) once max_bytes is exceeded.
+    """
+    output_path = Path(settings.TEMP_DIR) / f"{job_id}.{settings.AUDIO_FORMAT}"
+    update_job(job_id, status=JobStatus.processing, **_partial(output_path))
+    os.makedirs(settings.TEMP_DIR, exist_ok=True)
 
     try:
-        proc = await asyncio.create_subprocess_exec(
-            *cmd,
+        proc = await procs.spawn(
+            *_transcode_cmd("pipe:0", output_path),
+            stdin=asyncio.subprocess.PIPE,
             stdout=asyncio.subprocess.DEVNULL,
             stderr=asyncio.subprocess.PIPE,
         )
-        _, stderr = await asyncio.wait_for(proc.communicate(), timeout=300)
+    except OSError as e:
+        update_job(job_id, status=JobStatus.failed, error=str(e), error_class=type(e).__name__)
+        return
+    # Drain stderr concurrently, otherwise a chatty ffmpeg blocks while we block on its stdin
+    stderr_task = asyncio.create_task(proc.stderr.read())
+    received = 0
+    try:
+        async for chunk in chunks:
+            received += len(chunk)
+            if received > max_bytes:
+                raise UploadTooLarge()
+            try:
+                proc.stdin.write(chunk)
+                await proc.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                break  # ffmpeg stopped reading: clip limit reached, or the input is unreadable
+        try:
+            proc.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
 
+        await asyncio.wait_for(proc.wait(), timeout=300)
+        stderr = await stderr_task
         if proc.returncode != 0:
             raise RuntimeError(stderr.decode("utf-8", errors="replace")[:500])
+        metrics.mark(job_id, "encoded")
 
-        duration = await _get_duration(output_path)
+        duration = _ffmpeg_output_seconds(stderr)
+        if duration is None:
+            duration = await _get_duration(output_path)
+            metrics.mark(job_id, "probed")
         update_job(
             job_id,
             status=JobStatus.done,
             file_path=str(output_path),
             duration=duration,
         )
+    except UploadTooLarge:
+        raise
     except Exception as e:
-        update_job(job_id, status=JobStatus.failed, error=str(e))
+        update_job(job_id, status=JobStatus.failed, error=str(e), error_class=type(e).__name__)
     finally:
-        if os.path.exists(input_path):
-            os.remove(input_path)
+        await procs.reap(proc)
+        stderr_task.cancel()
+        if proc.returncode != 0 and output_path.exists():
+            output_path.unlink()
+
+
+async def _probe_audio_codec(file_path: str) -> str | None:
+    """Codec name of the first audio stream, e.g. ``aac`` or ``opus``; None if unknown."""
+    try:
+        proc = await procs.spawn(
+            *_resolve_bin("ffprobe"), "-v", "error",
+            "-select_streams", "a:0",
+            "-show_entries", "stream=codec_name",
+            "-of", "default=noprint_wrappers=1:nokey=1",
+            str(file_path),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        stdout, _ = await procs.communicate(proc, timeout=60)
+        return stdout.decode().strip() or None
+    except Exception:
+        return None
 
 
 async def _get_duration(file_path: Path) -> float | None:
+    """Fallback ffprobe — costs a process spawn, so only used when the job's own output lacked a duration."""
     try:
-        proc = await asyncio.create_subprocess_exec(
+        proc = await procs.spawn(
             *_resolve_bin("ffprobe"), "-v", "error",
             "-show_entries", "format=duration",
             "-of", "default=noprint_wrappers=1:nokey=1",
@@ -144,7 +924,7 @@ async def _get_duration(file_path: Path) -> float | None:
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.DEVNULL,
         )
-        stdout, _ = await proc.communicate()
+        stdout, _ = await procs.communicate(proc, timeout=60)
         return float(stdout.decode().strip())
     except Exception:
         return None
@@ -1,14 +1,17 @@
+import heapq
+import json
+import os
+import sqlite3
+import threading
 import uuid
 import time
 from typing import Dict, Optional
+from config import settings
 from models import JobStatus
 
-_store: Dict[str, dict] = {}
 
-
-def create_job() -> str:
-    job_id = str(uuid.uuid4())
-    _store[job_id] = {
+def _new_job() -> dict:
+    return {
         "status":     JobStatus.pending,
         "created_at": time.time(),
         "file_path":  None,
@@ -16,12 +19,198 @@ def create_job() -> str:
         "title":      None,
         "duration":   None,
     }
+
+
+class JobStore:
+    """Backend interface. Jobs are plain dicts; ``created_at`` is indexed for expiry."""
+
+    def create(self, job_id: str, job: dict) -> None:
+        raise NotImplementedError
+
+    def update(self, job_id: str, fields: dict) -> None:
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def delete(self, job_id: str) -> None:
+        raise NotImplementedError
+
+    def all(self) -> Dict[str, dict]:
+        raise NotImplementedError
+
+    def pop_expired(self, before: float) -> list[tuple[str, dict]]:
+        """Remove and return every job created before ``before`` — O(expired), not O(jobs)."""
+        raise NotImplementedError
+
+    def oldest_created_at(self) -> Optional[float]:
+        """created_at of the next job to expire, read from the index."""
+        raise NotImplementedError
+
+    def create_batch(self, batch_id: str, batch: dict) -> None:
+        raise NotImplementedError
+
+    def get_batch(self, batch_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+
+class MemoryJobStore(JobStore):
+    """Process-local dict plus a min-heap of (created_at, job_id). Lost on restart."""
+
+    def __init__(self) -> None:
+        self._jobs: Dict[str, dict] = {}
+        self._by_age: list[tuple[float, str]] = []
+        self._batches: Dict[str, dict] = {}   # insertion order == created_at order
+
+    def create(self, job_id: str, job: dict) -> None:
+        self._jobs[job_id] = job
+        heapq.heappush(self._by_age, (job["created_at"], job_id))
+
+    def update(self, job_id: str, fields: dict) -> None:
+        if job_id in self._jobs:
+            self._jobs[job_id].update(fields)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self._jobs.get(job_id)
+
+    def delete(self, job_id: str) -> None:
+        self._jobs.pop(job_id, None)   # its heap entry is skipped lazily in pop_expired
+
+    def all(self) -> Dict[str, dict]:
+        return self._jobs
+
+    def pop_expired(self, before: float) -> list[tuple[str, dict]]:
+        expired = []
+        while self._by_age and self._by_age[0][0] < before:
+            created_at, job_id = heapq.heappop(self._by_age)
+            job = self._jobs.get(job_id)
+            if job is not None and job["created_at"] == created_at:
+                expired.append((job_id, self._jobs.pop(job_id)))
+        while self._batches and next(iter(self._batches.values()))["created_at"] < before:
+            del self._batches[next(iter(self._batches))]
+        return expired
+
+    def oldest_created_at(self) -> Optional[float]:
+        while self._by_age:
+            created_at, job_id = self._by_age[0]
+            job = self._jobs.get(job_id)
+            if job is not None and job["created_at"] == created_at:
+                return created_at
+            heapq.heappop(self._by_age)   # deleted job: drop its stale heap entry
+        return None
+
+    def create_batch(self, batch_id: str, batch: dict) -> None:
+        self._batches[batch_id] = batch
+
+    def get_batch(self, batch_id: str) -> Optional[dict]:
+        return self._batches.get(batch_id)
+
+
+class SQLiteJobStore(JobStore):
+    """WAL-mode SQLite file: survives restarts and is shared by every worker process on the host."""
+
+    def __init__(self, path: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, created_at REAL NOT NULL, data TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs (created_at)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS batches ("
+            " id TEXT PRIMARY KEY, created_at REAL NOT NULL, data TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS batches_created_at ON batches (created_at)")
+
+    @staticmethod
+    def _load(data: str) -> dict:
+        job = json.loads(data)
+        job["status"] = JobStatus(job["status"])
+        return job
+
+    def create(self, job_id: str, job: dict) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, created_at, data) VALUES (?, ?, ?)",
+                (job_id, job["created_at"], json.dumps(job)),
+            )
+
+    def update(self, job_id: str, fields: dict) -> None:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if row:
+                    job = {**json.loads(row[0]), **fields}
+                    self._db.execute("UPDATE jobs SET data = ? WHERE id = ?", (json.dumps(job), job_id))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._load(row[0]) if row else None
+
+    def delete(self, job_id: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def all(self) -> Dict[str, dict]:
+        with self._lock:
+            rows = self._db.execute("SELECT id, data FROM jobs").fetchall()
+        return {job_id: self._load(data) for job_id, data in rows}
+
+    def pop_expired(self, before: float) -> list[tuple[str, dict]]:
+        with self._lock:
+            rows = self._db.execute(
+                "DELETE FROM jobs WHERE created_at < ? RETURNING id, data", (before,)
+            ).fetchall()
+            self._db.execute("DELETE FROM batches WHERE created_at < ?", (before,))
+        return [(job_id, self._load(data)) for job_id, data in rows]
+
+    def oldest_created_at(self) -> Optional[float]:
+        with self._lock:
+            return self._db.execute("SELECT MIN(created_at) FROM jobs").fetchone()[0]
+
+    def create_batch(self, batch_id: str, batch: dict) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO batches (id, created_at, data) VALUES (?, ?, ?)",
+                (batch_id, batch["created_at"], json.dumps(batch)),
+            )
+
+    def get_batch(self, batch_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("SELECT data FROM batches WHERE id = ?", (batch_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+def _make_store() -> JobStore:
+    # A per-process dict can't serve /jobs/{id} from a sibling worker, so multi-worker means SQLite
+    if settings.JOB_STORE == "sqlite" or settings.WORKERS > 1:
+        return SQLiteJobStore(settings.JOB_STORE_PATH or os.path.join(settings.TEMP_DIR, "jobs.db"))
+    if settings.JOB_STORE == "memory":
+        return MemoryJobStore()
+    raise ValueError(f"Unknown JOB_STORE '{settings.JOB_STORE}' (expected 'memory' or 'sqlite')")
+
+
+_store: JobStore = _make_store()
+
+
+def create_job() -> str:
+    job_id = str(uuid.uuid4())
+    _store.create(job_id, _new_job())
     return job_id
 
 
 def update_job(job_id: str, **kwargs) -> None:
-    if job_id in _store:
-        _store[job_id].update(kwargs)
+    _store.update(job_id, kwargs)
 
 
 def get_job(job_id: str) -> Optional[dict]:
@@ -29,8 +218,27 @@ def get_job(job_id: str) -> Optional[dict]:
 
 
 def delete_job(job_id: str) -> None:
-    _store.pop(job_id, None)
+    _store.delete(job_id)
 
 
 def get_all_jobs() -> Dict[str, dict]:
-    return _store
+    return _store.all()
+
+
+def pop_expired_jobs(before: float) -> list[tuple[str, dict]]:
+    return _store.pop_expired(before)
+
+
+def oldest_job_created_at() -> Optional[float]:
+    return _store.oldest_created_at()
+
+
+def create_batch(job_ids: list[str]) -> str:
+    """Group jobs (one per submitted item, duplicates repeated) under one id; expires like a job."""
+    batch_id = str(uuid.uuid4())
+    _store.create_batch(batch_id, {"created_at": time.time(), "job_ids": job_ids})
+    return batch_id
+
+
+def get_batch(batch_id: str) -> Optional[dict]:
+    return _store.get_batch(batch_id)
@@ -0,0 +1,37 @@
+import asyncio
+import fcntl
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+
+def try_lock(path: str) -> Optional[int]:
+    """Non-blocking exclusive flock on ``path``; returns the fd to pass to unlock(), or None if held.
+
+    flock locks are released by the kernel when the holder dies, so a crashed worker
+    process never leaves a slot or key locked.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def unlock(fd: int) -> None:
+    fcntl.flock(fd, fcntl.LOCK_UN)
+    os.close(fd)
+
+
+@asynccontextmanager
+async def file_lock(path: str, poll: float = 0.25) -> AsyncIterator[None]:
+    """Exclusive lock shared by every process on the host; waits without blocking the event loop."""
+    while (fd := try_lock(path)) is None:
+        await asyncio.sleep(poll)
+    try:
+        yield
+    finally:
+        unlock(fd)
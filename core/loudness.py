@@ -0,0 +1,141 @@
+"""Loudness normalisation stage (NORMALIZE_MODE) and the per-source measurement cache.
+
+off      — no filter; a matching source can be stream-copied.
+gain     — measure integrated loudness once (decode + ebur128, no encode), then a plain
+           ``volume`` filter. Measurements are cached per source, so repeats skip the decode.
+loudnorm — single-pass dynamic loudnorm: steadier on uneven material, far more CPU per minute.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+from typing import Optional
+from config import settings
+from core import procs
+
+LOUDNORM = "loudnorm=I=-16:TP=-1.5:LRA=11"
+TARGET_LUFS = -16.0
+CEILING_DBFS = -1.5     # keep sample peaks below this after the gain
+MAX_GAIN_DB = 20.0      # near-silent sources would otherwise be amplified into noise
+MAX_ENTRIES = 10_000
+
+_INTEGRATED_RE = re.compile(r"I:\s+(-?\d+(?:\.\d+)?) LUFS")
+_PEAK_RE = re.compile(r"Peak:\s+(-?\d+(?:\.\d+)?|-inf) dBFS")
+_FINGERPRINT_SAMPLE = 1024 * 1024
+
+
+def _dir() -> Path:
+    return Path(settings.TEMP_DIR) / "loudness"
+
+
+def _mode() -> str:
+    mode = settings.NORMALIZE_MODE
+    if mode not in ("off", "gain", "loudnorm"):
+        raise ValueError(f"Unknown NORMALIZE_MODE '{mode}' (expected 'off', 'gain' or 'loudnorm')")
+    return mode
+
+
+def enabled() -> bool:
+    return _mode() != "off"
+
+
+def needs_measurement() -> bool:
+    return _mode() == "gain"
+
+
+def gain_db(measured: dict) -> float:
+    gain = TARGET_LUFS - measured["integrated"]
+    if measured.get("peak") is not None:
+        gain = min(gain, CEILING_DBFS - measured["peak"])
+    return round(max(-MAX_GAIN_DB, min(gain, MAX_GAIN_DB)), 2)
+
+
+def filter_args(measured: Optional[dict]) -> list[str]:
+    """ffmpeg ``-af`` arguments for the configured mode. Gain mode without a measurement
+    (piped or remote input that can't be read twice) falls back to single-pass loudnorm."""
+    mode = _mode()
+    if mode == "off":
+        return []
+    if mode == "gain" and measured:
+        return ["-af", f"volume={gain_db(measured)}dB"]
+    return ["-af", LOUDNORM]
+
+
+def parse_ebur128(stderr: str) -> Optional[dict]:
+    """Integrated loudness and sample peak from the ebur128 filter's closing summary."""
+    integrated = _INTEGRATED_RE.findall(stderr)
+    if not integrated:
+        return None
+    peaks = _PEAK_RE.findall(stderr)
+    peak = peaks[-1] if peaks else None
+    return {
+        "integrated": float(integrated[-1]),
+        "peak": None if peak in (None, "-inf") else float(peak),
+    }
+
+
+async def measure(ffmpeg: list[str], input_args: list[str], input_path: str) -> Optional[dict]:
+    """Decode ``input_path`` once through ebur128; no encode, no output file."""
+    proc = await procs.spawn(
+        *ffmpeg, "-hide_banner", "-nostats", *input_args, "-i", input_path,
+        "-vn", "-af", "ebur128=framelog=quiet:peak=sample", "-f", "null", "-",
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    _, stderr = await procs.communicate(proc, timeout=300)
+    if proc.returncode != 0:
+        return None
+    return parse_ebur128(stderr.decode("utf-8", errors="replace"))
+
+
+def file_fingerprint(path: str) -> str:
+    """Cheap identity for an uploaded file: size plus its first and last MiB."""
+    h = hashlib.blake2b(digest_size=16)
+    size = os.path.getsize(path)
+    h.update(str(size).encode())
+    with open(path, "rb") as f:
+        h.update(f.read(_FINGERPRINT_SAMPLE))
+        if size > 2 * _FINGERPRINT_SAMPLE:
+            f.seek(-_FINGERPRINT_SAMPLE, os.SEEK_END)
+            h.update(f.read(_FINGERPRINT_SAMPLE))
+    return h.hexdigest()
+
+
+def lookup(key: Optional[str]) -> Optional[dict]:
+    if not key:
+        return None
+    try:
+        with open(_dir() / f"{key}.json", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def store(key: Optional[str], measured: Optional[dict]) -> None:
+    if not key or not measured:
+        return
+    try:
+        os.makedirs(_dir(), exist_ok=True)
+        tmp = _dir() / f"{key}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(measured, f)
+        os.replace(tmp, _dir() / f"{key}.json")   # atomic: sibling workers never read half a file
+    except OSError:
+        pass
+
+
+def prune() -> int:
+    """Keep the newest MAX_ENTRIES measurements."""
+    try:
+        found = [(p, p.stat().st_mtime) for p in _dir().glob("*.json")]
+    except FileNotFoundError:
+        return 0
+    excess = sorted(found, key=lambda e: e[1])[:max(0, len(found) - MAX_ENTRIES)]
+    for path, _ in excess:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+    return len(excess)
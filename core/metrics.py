@@ -0,0 +1,133 @@
+"""Per-job stage timestamps and the Prometheus text exposition served at /metrics.
+
+A job's ``stages`` record when it reached each point of its pipeline:
+
+queued → started → resolved → downloaded → encoded → probed → finished
+
+Stages a path doesn't have are skipped (an upload is never resolved or downloaded;
+``probed`` only happens when ffmpeg didn't report the duration). Each mark observes the
+time since the job's previous stage in a per-kind, per-stage histogram.
+
+Everything is plain in-process counters, so with WORKERS > 1 each process reports its own.
+"""
+import time
+from typing import Optional
+from core import cache, procs, storage
+from core.job_store import get_job, update_job
+from models import JobStatus
+
+STAGES = ("queued", "started", "resolved", "downloaded", "encoded", "probed", "finished")
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_histograms: dict[str, dict[tuple, list]] = {"stage": {}, "job": {}}   # labels -> [bucket counts..., sum, count]
+_jobs: dict[tuple[str, str], int] = {}       # (kind, status) -> finished jobs
+_failures: dict[tuple[str, str], int] = {}   # (kind, error class) -> failed jobs
+
+
+def _observe(name: str, labels: tuple, seconds: float) -> None:
+    series = _histograms[name].setdefault(labels, [0] * (len(BUCKETS) + 2))
+    for i, bound in enumerate(BUCKETS):
+        if seconds <= bound:
+            series[i] += 1
+    series[-2] += seconds
+    series[-1] += 1
+
+
+def mark(job_id: str, stage: str, kind: Optional[str] = None) -> None:
+    """Record that a job reached ``stage``. Only the first mark of a stage counts."""
+    job = get_job(job_id)
+    if job is None:
+        return
+    stages = job.get("stages") or {"queued": round(job["created_at"], 3)}
+    if stage in stages:
+        return
+    now = time.time()
+    kind = kind or job.get("kind") or "unknown"
+    _observe("stage", (kind, stage), max(0.0, now - max(stages.values())))
+    update_job(job_id, kind=kind, stages={**stages, stage: round(now, 3)})
+
+
+def finish(job_id: str, kind: Optional[str] = None) -> None:
+    """Close a job's timeline and count its outcome (called once the job's task has ended)."""
+    job = get_job(job_id)
+    if job is None or job["status"] not in (JobStatus.done, JobStatus.failed, JobStatus.cancelled):
+        return   # coalesced into another job's extraction: finished when the leader finishes it
+    mark(job_id, "finished", kind)
+    job = get_job(job_id)
+    kind, status = job.get("kind") or "unknown", job["status"].value
+    _jobs[(kind, status)] = _jobs.get((kind, status), 0) + 1
+    _observe("job", (kind, status), max(0.0, job["stages"]["finished"] - job["stages"]["queued"]))
+    if status == JobStatus.failed:
+        key = (kind, job.get("error_class") or "unknown")
+        _failures[key] = _failures.get(key, 0) + 1
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple) -> str:
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}" if pairs else ""
+
+
+def _histogram_lines(metric: str, help_text: str, names: tuple[str, ...], series: dict) -> list[str]:
+    lines = [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+    for values, counts in sorted(series.items()):
+        for bound, count in zip((*BUCKETS, "+Inf"), (*counts[:len(BUCKETS)], counts[-1])):
+            lines.append(f"{metric}_bucket{_labels((*names, 'le'), (*values, bound))} {count}")
+        lines.append(f"{metric}_sum{_labels(names, values)} {round(counts[-2], 6)}")
+        lines.append(f"{metric}_count{_labels(names, values)} {counts[-1]}")
+    return lines
+
+
+def _simple_lines(metric: str, kind: str, help_text: str, names: tuple[str, ...], series: dict) -> list[str]:
+    lines = [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+    lines += [f"{metric}{_labels(names, values)} {value}" for values, value in sorted(series.items())]
+    return lines
+
+
+def render(scheduler_stats: dict) -> str:
+    """Prometheus text format (version 0.0.4). Scans TEMP_DIR once — run it off the event loop."""
+    disk = storage.usage()
+    cache_stats = cache.stats()
+    child_stats = procs.stats()
+    lines = [
+        *_histogram_lines(
+            "e2a_stage_seconds", "Time from a job's previous stage to this one.",
+            ("kind", "stage"), _histograms["stage"],
+        ),
+        *_histogram_lines(
+            "e2a_job_seconds", "Time from queued to finished, by outcome.",
+            ("kind", "status"), _histograms["job"],
+        ),
+        *_simple_lines("e2a_jobs_total", "counter", "Jobs finished, by outcome.", ("kind", "status"), _jobs),
+        *_simple_lines(
+            "e2a_job_failures_total", "counter", "Failed jobs by error class.", ("kind", "error_class"), _failures,
+        ),
+        *_simple_lines(
+            "e2a_queue_depth", "gauge", "Jobs waiting for a worker slot.", ("kind",),
+            {(kind,): s["queued"] for kind, s in scheduler_stats.items()},
+        ),
+        *_simple_lines(
+            "e2a_jobs_running", "gauge", "Jobs holding a worker slot.", ("kind",),
+            {(kind,): s["running"] for kind, s in scheduler_stats.items()},
+        ),
+        *_simple_lines(
+            "e2a_subprocesses_running", "gauge", "yt-dlp/ffmpeg/ffprobe children alive.", (),
+            {(): child_stats["running"]},
+        ),
+        *_simple_lines(
+            "e2a_subprocesses_spawned_total", "counter", "Children started, by program.", ("program",),
+            {(program,): n for program, n in child_stats["spawned"].items()},
+        ),
+        *_simple_lines(
+            "e2a_temp_dir_bytes", "gauge", "Bytes on disk in TEMP_DIR by category.", ("category",),
+            {(category,): n for category, n in disk.items() if category != "total"},
+        ),
+        *_simple_lines(
+            "e2a_cache_lookups_total", "counter", "Result-cache lookups.", ("result",),
+            {("hit",): cache_stats["hits"], ("miss",): cache_stats["misses"]},
+        ),
+    ]
+    return "\n".join(lines) + "\n"
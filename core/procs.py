@@ -0,0 +1,71 @@
+"""Child-process lifecycle for yt-dlp / ffmpeg / ffprobe.
+
+Every child starts in its own session, i.e. its own process group, so killing the group
+also takes down whatever it spawned (yt-dlp runs ffmpeg for post-processing). Callers
+reap in a ``finally``: a timeout, a cancelled job or shutdown never leaves a child behind.
+"""
+import asyncio
+import os
+import signal
+import weakref
+from typing import Optional
+
+_live: "weakref.WeakSet[asyncio.subprocess.Process]" = weakref.WeakSet()
+_spawned: dict[str, int] = {}
+
+
+def _program(cmd: tuple[str, ...]) -> str:
+    # [python, -m, yt_dlp] when yt-dlp runs from the interpreter's own site-packages
+    if len(cmd) > 2 and cmd[1] == "-m":
+        return cmd[2]
+    return os.path.basename(cmd[0])
+
+
+async def spawn(*cmd: str, **kwargs) -> asyncio.subprocess.Process:
+    proc = await asyncio.create_subprocess_exec(*cmd, start_new_session=True, **kwargs)
+    _live.add(proc)
+    program = _program(cmd)
+    _spawned[program] = _spawned.get(program, 0) + 1
+    return proc
+
+
+def kill(proc: asyncio.subprocess.Process) -> None:
+    """SIGKILL the child's whole process group."""
+    if proc.returncode is not None:
+        return
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+async def reap(proc: asyncio.subprocess.Process) -> None:
+    """Kill ``proc`` if it is still running and wait for it to exit."""
+    if proc.returncode is None:
+        kill(proc)
+        await proc.wait()
+
+
+async def communicate(
+    proc: asyncio.subprocess.Process, timeout: Optional[float] = None,
+) -> tuple[bytes, bytes]:
+    """``proc.communicate()`` that kills the process on timeout or cancellation."""
+    try:
+        return await asyncio.wait_for(proc.communicate(), timeout)
+    finally:
+        await reap(proc)
+
+
+def stats() -> dict:
+    return {
+        "running": sum(1 for proc in _live if proc.returncode is None),
+        "spawned": dict(_spawned),
+    }
+
+
+def kill_all() -> int:
+    """Shutdown backstop: kill every child still running. Returns how many were killed."""
+    running = [proc for proc in _live if proc.returncode is None]
+    for proc in running:
+        kill(proc)
+    return len(running)
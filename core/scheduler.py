@@ -0,0 +1,251 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Optional
+from config import settings
+from core import locks, metrics
+from core.cleanup import remove_job_files
+from core.job_store import get_job, update_job
+from models import JobStatus
+
+_CANCEL_POLL_SECONDS = 1.0   # WORKERS > 1: how often a running job checks for a DELETE from a sibling
+_CANCEL_GRACE_SECONDS = 10   # how long cancel() waits for a job to unwind (children killed, files removed)
+
+
+class QueueFullError(Exception):
+    """Raised by submit() when the backlog is at QUEUE_MAX_SIZE; carries a Retry-After hint."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("queue is full")
+        self.retry_after = retry_after
+
+
+def _slot_path(kind: str, i: int) -> str:
+    return os.path.join(settings.TEMP_DIR, "slots", f"{kind}-{i}.lock")
+
+
+def _limits() -> dict[str, int]:
+    return {
+        "youtube":   max(1, settings.YOUTUBE_CONCURRENCY),
+        "transcode": max(1, settings.TRANSCODE_CONCURRENCY),
+    }
+
+
+class Scheduler:
+    """Per-kind bounded worker pools fed from priority queues (FIFO within a priority).
+
+    With WORKERS > 1 each process keeps its own queue, but a job only starts after
+    claiming one of the kind's host-wide slots (flock files under TEMP_DIR/slots),
+    so the concurrency limits hold for the whole host rather than per process.
+    """
+
+    def __init__(self) -> None:
+        self._queues: dict[str, list] = {kind: [] for kind in _limits()}
+        self._running: dict[str, int] = {kind: 0 for kind in _limits()}
+        self._avg_runtime: dict[str, float] = {kind: 30.0 for kind in _limits()}
+        self._seq = itertools.count()
+        self._wakeup: dict[str, asyncio.Event] = {}
+        self._slots: dict[str, asyncio.Semaphore] = {}
+        self._workers: list[asyncio.Task] = []
+        self._active: dict[str, asyncio.Task] = {}
+        self._stopping = False
+
+    def submit(
+        self,
+        kind: str,
+        job_id: str,
+        fn: Callable[..., Awaitable[None]],
+        *args,
+        priority: int = 0,
+    ) -> int:
+        """Queue ``fn(job_id, *args)``; higher priority runs first. Returns the 1-based queue position."""
+        if self.is_full():
+            raise QueueFullError(self.retry_after(kind))
+        heapq.heappush(self._queues[kind], (-priority, next(self._seq), job_id, fn, args))
+        if kind in self._wakeup:
+            self._wakeup[kind].set()
+        return self.position(job_id)
+
+    @asynccontextmanager
+    async def direct(self, kind: str) -> AsyncIterator[None]:
+        """Run work outside the queue (e.g. a transcode fed by a live request body) while
+        still counting against the kind's concurrency limit. Raises QueueFullError if no
+        slot is free right now, since such work can't wait in line."""
+        slot = self._slots.get(kind)
+        if slot is None or slot.locked():
+            raise QueueFullError(self.retry_after(kind))
+        async with slot:
+            host_slot = self._try_host_slot(kind)
+            if host_slot is False:
+                raise QueueFullError(self.retry_after(kind))
+            self._running[kind] += 1
+            try:
+                yield
+            finally:
+                self._running[kind] -= 1
+                self._release_host_slot(host_slot)
+
+    async def run_tracked(self, kind: str, job_id: str, coro: Awaitable[None]) -> None:
+        """Run ``coro`` as ``job_id``'s task so cancel() can stop it. Returns when it finishes
+        or is cancelled; its other exceptions propagate. If the caller itself is cancelled
+        (shutdown, client gone) the job is cancelled with it."""
+        metrics.mark(job_id, "started", kind)
+        task = asyncio.create_task(self._cancellable(job_id, coro))
+        self._active[job_id] = task
+        try:
+            while not task.done():
+                # A sibling worker process can only flag the job in the shared store
+                poll = _CANCEL_POLL_SECONDS if settings.WORKERS > 1 else None
+                await asyncio.wait({task}, timeout=poll)
+                if not task.done() and _cancel_requested(job_id):
+                    task.cancel()
+        except asyncio.CancelledError:
+            task.cancel()
+            await asyncio.wait({task})
+            raise
+        finally:
+            self._active.pop(job_id, None)
+            metrics.finish(job_id, kind)
+        if not task.cancelled():
+            task.result()
+
+    async def cancel(self, job_id: str) -> bool:
+        """Drop a queued job, or cancel a running one and wait for it to unwind.
+        False if this process doesn't hold the job."""
+        for kind, queue in self._queues.items():
+            for i, item in enumerate(queue):
+                if item[2] == job_id:
+                    queue.pop(i)
+                    heapq.heapify(queue)
+                    metrics.finish(job_id, kind)
+                    await asyncio.to_thread(remove_job_files, job_id)
+                    return True
+        task = self._active.get(job_id)
+        if task is None:
+            return False
+        task.cancel()
+        await asyncio.wait({task}, timeout=_CANCEL_GRACE_SECONDS)
+        return True
+
+    async def _cancellable(self, job_id: str, coro: Awaitable[None]) -> None:
+        try:
+            await coro
+        except asyncio.CancelledError:
+            # Children are already killed by the extractor's finally blocks; drop what they wrote
+            if self._stopping:
+                update_job(job_id, status=JobStatus.failed, error="interrupted by shutdown", error_class="Shutdown")
+            else:
+                update_job(job_id, status=JobStatus.cancelled)
+            await asyncio.to_thread(remove_job_files, job_id)
+            raise
+
+    def is_full(self) -> bool:
+        return self.queued() >= settings.QUEUE_MAX_SIZE
+
+    def room(self) -> int:
+        """How many more jobs submit() will accept before the queue is full."""
+        return max(0, settings.QUEUE_MAX_SIZE - self.queued())
+
+    def queued(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def position(self, job_id: str) -> Optional[int]:
+        for q in self._queues.values():
+            for i, item in enumerate(sorted(q), start=1):
+                if item[2] == job_id:
+                    return i
+        return None
+
+    def retry_after(self, kind: str) -> int:
+        """Seconds until roughly one queue's worth of work has drained."""
+        backlog = len(self._queues[kind]) + self._running[kind]
+        return max(1, math.ceil(backlog / _limits()[kind] * self._avg_runtime[kind]))
+
+    def stats(self) -> dict:
+        return {
+            kind: {
+                "queued":  len(self._queues[kind]),
+                "running": self._running[kind],
+                "limit":   limit,
+                "avg_runtime_sec": round(self._avg_runtime[kind], 2),
+            }
+            for kind, limit in _limits().items()
+        }
+
+    async def start(self) -> None:
+        self._stopping = False
+        for kind, limit in _limits().items():
+            self._wakeup[kind] = asyncio.Event()
+            self._slots[kind] = asyncio.Semaphore(limit)
+            if self._queues[kind]:
+                self._wakeup[kind].set()
+            for _ in range(limit):
+                self._workers.append(asyncio.create_task(self._worker(kind)))
+
+    async def stop(self) -> None:
+        self._stopping = True
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        self._wakeup.clear()
+        self._slots.clear()
+
+    @staticmethod
+    def _try_host_slot(kind: str) -> int | None | bool:
+        """fd of a claimed host-wide slot, None when single-process (no claim needed), False if all busy."""
+        if settings.WORKERS <= 1:
+            return None
+        for i in range(_limits()[kind]):
+            fd = locks.try_lock(_slot_path(kind, i))
+            if fd is not None:
+                return fd
+        return False
+
+    @staticmethod
+    def _release_host_slot(fd: int | None) -> None:
+        if fd is not None:
+            locks.unlock(fd)
+
+    async def _worker(self, kind: str) -> None:
+        queue, wakeup, slot = self._queues[kind], self._wakeup[kind], self._slots[kind]
+        while True:
+            if not queue:
+                wakeup.clear()
+                await wakeup.wait()
+                continue
+            async with slot:
+                while (host_slot := self._try_host_slot(kind)) is False:
+                    await asyncio.sleep(0.25)
+                if not queue:
+                    self._release_host_slot(host_slot)
+                    continue
+                _, _, job_id, fn, args = heapq.heappop(queue)
+                if _cancel_requested(job_id):
+                    self._release_host_slot(host_slot)
+                    metrics.finish(job_id, kind)
+                    await asyncio.to_thread(remove_job_files, job_id)
+                    continue
+                self._running[kind] += 1
+                started = time.monotonic()
+                try:
+                    await self.run_tracked(kind, job_id, fn(job_id, *args))
+                except Exception:
+                    pass  # extractors record their own failures on the job
+                finally:
+                    self._running[kind] -= 1
+                    self._release_host_slot(host_slot)
+                    elapsed = time.monotonic() - started
+                    self._avg_runtime[kind] = 0.8 * self._avg_runtime[kind] + 0.2 * elapsed
+
+
+def _cancel_requested(job_id: str) -> bool:
+    job = get_job(job_id)
+    return job is not None and job["status"] == JobStatus.cancelled
+
+
+scheduler = Scheduler()
@@ -0,0 +1,194 @@
+import asyncio
+import os
+import stat
+from email.utils import formatdate, parsedate_to_datetime
+from typing import AsyncIterator, Callable, Optional
+
+import anyio
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response, StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+MEDIA_TYPES = {
+    "mp3":  "audio/mpeg",
+    "m4a":  "audio/mp4",
+    "aac":  "audio/aac",
+    "opus": "audio/ogg",
+    "ogg":  "audio/ogg",
+    "wav":  "audio/wav",
+    "flac": "audio/flac",
+    "webm": "audio/webm",
+}
+
+
+FOLLOW_CHUNK_BYTES = 64 * 1024
+FOLLOW_POLL_SECONDS = 0.1
+FOLLOW_IDLE_TIMEOUT = 60   # give up on a writer that has produced nothing for this long
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class WriterFailed(Exception):
+    """Raised mid-body so the server aborts the connection instead of ending a truncated file cleanly."""
+
+
+def media_type(path: str) -> str:
+    return MEDIA_TYPES.get(os.path.splitext(path)[1].lstrip(".").lower(), "application/octet-stream")
+
+
+def etag(st: os.stat_result) -> str:
+    # inode is part of the tag, so a cache hit hard-linked into another job validates the same
+    return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def parse_range(header: str, size: int) -> Optional[tuple[int, int]]:
+    """Inclusive (start, end) for a single ``bytes=`` range, None to serve the whole file
+    (absent, malformed or multi-range — RFC 9110 lets a server ignore those)."""
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep or (first and not first.isdigit()) or (last and not last.isdigit()) or not (first or last):
+        return None
+    if not first:                              # bytes=-N: the last N bytes
+        if int(last) == 0:
+            raise RangeNotSatisfiable
+        return max(0, size - int(last)), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def _not_modified(request: Request, tag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        return "*" in tags or tag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _range_applies(request: Request, tag: str, mtime: float) -> bool:
+    """If-Range: only honour Range when the client's copy is still the current file."""
+    if_range = request.headers.get("if-range")
+    if if_range is None:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == tag
+    try:
+        return int(mtime) == parsedate_to_datetime(if_range).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+class _PartialFileResponse(Response):
+    chunk_size = 256 * 1024
+
+    def __init__(self, path: str, start: int, end: int, headers: dict, media_type: str) -> None:
+        self.path, self.start, self.end = path, start, end
+        self.status_code = 206
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            remaining = self.end - self.start + 1
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def serve_file(request: Request, path: str, filename: str) -> Response:
+    """A download response with validators: 304 on a matching If-None-Match/If-Modified-Since,
+    206 for a single byte range, 416 for an unsatisfiable one, else the whole file.
+
+    Whole-file responses go through Starlette's FileResponse, which hands the path to the
+    server (``http.response.pathsend``, i.e. sendfile) when the ASGI server supports it.
+    """
+    st = os.stat(path)
+    if not stat.S_ISREG(st.st_mode):
+        raise FileNotFoundError(path)
+    tag = etag(st)
+    headers = {
+        "etag": tag,
+        "last-modified": formatdate(st.st_mtime, usegmt=True),
+        "accept-ranges": "bytes",
+    }
+    if _not_modified(request, tag, st.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    kind = media_type(path)
+    header = request.headers.get("range")
+    if header and _range_applies(request, tag, st.st_mtime):
+        try:
+            byte_range = parse_range(header, st.st_size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "content-range": f"bytes */{st.st_size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            return _PartialFileResponse(path, start, end, media_type=kind, headers={
+                **headers,
+                "content-range": f"bytes {start}-{end}/{st.st_size}",
+                "content-length": str(end - start + 1),
+                "content-disposition": f'attachment; filename="{filename}"',
+            })
+
+    return FileResponse(path, headers=headers, media_type=kind, filename=filename, stat_result=st)
+
+
+def follow_file(path: str, filename: str, state: Callable[[], str]) -> StreamingResponse:
+    """Stream a file another process is still writing, with chunked transfer (no length known).
+
+    ``state()`` reports the writer: ``"writing"``, ``"done"`` (send the rest, then end) or
+    anything else for a failure, which aborts the response so the client sees an error.
+    """
+    async def body() -> AsyncIterator[bytes]:
+        idle = 0.0
+        while not os.path.exists(path):   # ffmpeg creates the file once it has probed its input
+            if state() != "writing" or idle >= FOLLOW_IDLE_TIMEOUT:
+                raise WriterFailed(path)
+            await asyncio.sleep(FOLLOW_POLL_SECONDS)
+            idle += FOLLOW_POLL_SECONDS
+
+        async with await anyio.open_file(path, mode="rb") as file:
+            idle = 0.0
+            while True:
+                chunk = await file.read(FOLLOW_CHUNK_BYTES)
+                if chunk:
+                    idle = 0.0
+                    yield chunk
+                    continue
+                current = state()
+                if current == "done":
+                    while chunk := await file.read(FOLLOW_CHUNK_BYTES):
+                        yield chunk
+                    return
+                if current != "writing" or idle >= FOLLOW_IDLE_TIMEOUT:
+                    raise WriterFailed(path)
+                await asyncio.sleep(FOLLOW_POLL_SECONDS)
+                idle += FOLLOW_POLL_SECONDS
+
+    return StreamingResponse(body(), media_type=media_type(path), headers={
+        "content-disposition": f'attachment; filename="{filename}"',
+        "cache-control": "no-store",
+    })
@@ -0,0 +1,132 @@
+import os
+import re
+import threading
+from config import settings
+from core import cache
+from core.cleanup import job_files
+from core.job_store import get_all_jobs, update_job
+from models import JobStatus
+
+_JOB_FILE_RE = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}(_input)?")
+_lock = threading.Lock()
+_reserved: dict[str, int] = {}    # job_id -> bytes promised to a job that hasn't written them yet
+_evicted = {"cache_entries": 0, "results": 0}
+
+
+class StorageFullError(Exception):
+    pass
+
+
+def _quota() -> int:
+    return settings.STORAGE_QUOTA_MB * 1024 * 1024
+
+
+def usage() -> dict:
+    """Bytes on disk in TEMP_DIR by category. Hard links (cache ↔ job file) are counted once."""
+    seen: set[tuple[int, int]] = set()
+    totals = {"outputs": 0, "inputs": 0, "cache": 0, "other": 0}
+
+    def add(category: str, entry: os.DirEntry) -> None:
+        st = entry.stat()
+        if (st.st_dev, st.st_ino) in seen:
+            return
+        seen.add((st.st_dev, st.st_ino))
+        totals[category] += st.st_size
+
+    cache_dir = os.path.join(settings.TEMP_DIR, "cache")
+    for directory, default in ((cache_dir, "cache"), (settings.TEMP_DIR, None)):
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            try:
+                if not entry.is_file():
+                    continue
+                match = _JOB_FILE_RE.match(entry.name)
+                category = default or ("inputs" if match and match.group(1) else "outputs" if match else "other")
+                add(category, entry)
+            except FileNotFoundError:
+                continue
+    totals["total"] = sum(totals.values())
+    return totals
+
+
+def expected_output_bytes(seconds: float | None) -> int:
+    """Rough size of one encoded result: AUDIO_QUALITY bitrate × duration (VBR levels → 256k)."""
+    match = re.fullmatch(r"(\d+)[kK]", settings.AUDIO_QUALITY)
+    bitrate = int(match.group(1)) * 1000 if match else 256_000
+    return int(bitrate / 8 * (seconds or settings.MAX_DURATION_SECONDS) * 1.1)
+
+
+def reserve(job_id: str, nbytes: int) -> None:
+    """Promise ``nbytes`` to a job, evicting old results if needed; raises StorageFullError otherwise."""
+    quota = _quota()
+    with _lock:
+        if quota <= 0:
+            _reserved[job_id] = nbytes
+            return
+        used = usage()["total"]
+        while used + sum(_reserved.values()) + nbytes > quota:
+            freed = _evict_one()
+            if freed is None:
+                raise StorageFullError(
+                    f"مساحة التخزين المؤقت ممتلئة ({settings.STORAGE_QUOTA_MB}MB)"
+                )
+            used -= freed
+        _reserved[job_id] = nbytes
+
+
+def release(job_id: str) -> None:
+    """Drop a job's reservation once its files are on disk (and so counted by usage())."""
+    with _lock:
+        _reserved.pop(job_id, None)
+
+
+def _evict_one() -> int | None:
+    """Free the least valuable bytes: LRU cache entry first, then the least recently
+    downloaded finished result (never-downloaded results count from creation).
+    Returns bytes actually freed (0 if the file is still hard-linked elsewhere), None if nothing is evictable."""
+    entries = cache.entries()
+    if entries:
+        path, st = min(entries, key=lambda e: e[1].st_mtime)
+        cache.remove(path)
+        _evicted["cache_entries"] += 1
+        return st.st_size if st.st_nlink == 1 else 0
+
+    done = [
+        (job.get("downloaded_at") or job["created_at"], job_id, job)
+        for job_id, job in get_all_jobs().items()
+        if job["status"] == JobStatus.done and job.get("file_path") and job_id not in _reserved
+    ]
+    if not done:
+        return None
+    _, job_id, job = min(done, key=lambda d: d[0])
+    size = 0
+    for path in job_files(job):
+        try:
+            st = os.stat(path)
+            os.remove(path)
+            size += st.st_size if st.st_nlink == 1 else 0
+        except FileNotFoundError:
+            pass
+    update_job(
+        job_id,
+        status=JobStatus.failed,
+        file_path=None,
+        renditions=None,
+        error="حُذف الملف لتحرير مساحة التخزين، أعد إرسال الطلب",
+    )
+    _evicted["results"] += 1
+    return size
+
+
+def stats() -> dict:
+    with _lock:
+        reserved = sum(_reserved.values())
+    return {
+        "usage": usage(),
+        "reserved": reserved,
+        "quota": _quota() or None,
+        "evicted": dict(_evicted),
+    }
@@ -0,0 +1,92 @@
+"""Pre-flight video metadata (yt-dlp ``--dump-single-json``) cached per video.
+
+The info JSON of a resolved URL is kept under TEMP_DIR/info for INFO_CACHE_TTL_SECONDS,
+keyed by YouTube video ID (else the URL) and the yt-dlp format selector it was resolved
+with. The API uses it to reject over-long or over-size videos before queueing them; the
+download reads the same file with ``--load-info-json`` instead of extracting the page again.
+"""
+import json
+import os
+import time
+from pathlib import Path
+from typing import Optional
+from config import settings
+from core import cache
+
+_GRACE_SECONDS = 600   # a path lookup() hands out stays on disk at least this long
+
+
+class VideoRejected(Exception):
+    """The video can't be extracted within this service's limits, or at all."""
+
+
+def _dir() -> Path:
+    return Path(settings.TEMP_DIR) / "info"
+
+
+def _path(url: str, selector: str) -> Path:
+    video_id = cache.canonical_video_id(url)
+    return _dir() / f"{cache.cache_key('info', video_id or url, selector)}.json"
+
+
+def lookup(url: str, selector: str) -> Optional[Path]:
+    """The cached info file for ``url`` if it is younger than INFO_CACHE_TTL_SECONDS."""
+    path = _path(url, selector)
+    try:
+        age = time.time() - path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+    return path if age < settings.INFO_CACHE_TTL_SECONDS else None
+
+
+def load(path: Optional[Path]) -> Optional[dict]:
+    if path is None:
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def store(url: str, selector: str, raw: bytes) -> Path:
+    path = _path(url, selector)
+    os.makedirs(path.parent, exist_ok=True)
+    tmp = path.with_name(f"{path.stem}.{os.getpid()}.tmp")
+    tmp.write_bytes(raw)
+    os.replace(tmp, path)   # atomic: a concurrent download never reads half a file
+    return path
+
+
+def check_limits(info: dict) -> None:
+    """Raise VideoRejected if the video breaks MAX_DURATION_SECONDS or MAX_FILE_SIZE_MB.
+
+    Mirrors the download's own --match-filter / --max-filesize, which judge the whole
+    video and the selected format's size even when only a clip is wanted.
+    """
+    duration = info.get("duration")
+    if duration and duration > settings.MAX_DURATION_SECONDS:
+        raise VideoRejected(
+            f"مدة الفيديو {int(duration)} ثانية تتجاوز الحد ({settings.MAX_DURATION_SECONDS} ثانية)"
+        )
+    size = info.get("filesize") or info.get("filesize_approx")
+    if size and size > settings.MAX_FILE_SIZE_MB * 1024 * 1024:
+        raise VideoRejected(f"حجم الصوت {size / 2**20:.0f}MB يتجاوز الحد ({settings.MAX_FILE_SIZE_MB}MB)")
+
+
+def prune() -> int:
+    """Drop info files past their TTL (plus a grace period for downloads still reading them)."""
+    cutoff = time.time() - settings.INFO_CACHE_TTL_SECONDS - _GRACE_SECONDS
+    removed = 0
+    try:
+        entries = list(os.scandir(_dir()))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
@@ -0,0 +1,158 @@
+"""In-process yt-dlp engine (YTDLP_ENGINE=pool): pre-warmed workers import yt_dlp once
+and run jobs through YoutubeDL, fed the same argv as the subprocess engine."""
+import asyncio
+import functools
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+from config import settings
+
+_pool: Optional[ProcessPoolExecutor] = None
+_progress_queue = None
+_drain_thread: Optional[threading.Thread] = None
+
+# Set in each worker process by _init_worker
+_worker_queue = None
+
+
+def _init_worker(progress_queue) -> None:
+    global _worker_queue
+    _worker_queue = progress_queue
+    import yt_dlp  # noqa: F401 — the expensive import, paid once per worker
+
+
+def _warm() -> None:
+    pass
+
+
+def _cancel_marker(job_id: str) -> str:
+    # A worker can't be interrupted from outside without breaking the pool, so a cancelled
+    # job leaves a marker that the worker's progress hook checks and aborts on
+    return os.path.join(settings.TEMP_DIR, "pool-cancel", job_id)
+
+
+def progress_fields(d: dict) -> dict:
+    """Job fields for a yt-dlp progress-hook payload."""
+    total = d.get("total_bytes") or d.get("total_bytes_estimate")
+    done = d.get("downloaded_bytes")
+    return {
+        "progress":         round(done / total * 100, 1) if done is not None and total else None,
+        "downloaded_bytes": done,
+        "total_bytes":      int(total) if total else None,
+        "eta":              d.get("eta"),
+    }
+
+
+def _process(ydl, parsed) -> Optional[dict]:
+    """Extract and download; from the pre-flight's info JSON when given --load-info-json."""
+    import yt_dlp
+
+    if not parsed.options.load_info_filename:
+        return ydl.extract_info(parsed.urls[0], download=True)
+    with open(parsed.options.load_info_filename, encoding="utf-8") as f:
+        info = ydl.sanitize_info(json.load(f), True)
+    try:
+        return ydl.process_ie_result(info, download=True)
+    except yt_dlp.utils.DownloadError:
+        # Like yt-dlp's own --load-info-json: stale format URLs, so resolve the page afresh
+        return ydl.extract_info(info["webpage_url"], download=True)
+
+
+def _download(job_id: str, args: list[str]) -> dict:
+    """Runs inside a worker: download one job and return its title and duration."""
+    import yt_dlp
+
+    parsed = yt_dlp.parse_options(args)
+    # ignoreerrors=False: raise the real DownloadError rather than returning None
+    opts = {**parsed.ydl_opts, "quiet": True, "noprogress": True, "ignoreerrors": False}
+    opts.pop("forceprint", None)   # metadata comes back as the return value instead
+
+    last_sent = [0.0]
+    marker = _cancel_marker(job_id)
+
+    def hook(d: dict) -> None:
+        now = time.monotonic()
+        if d.get("status") == "downloading" and now - last_sent[0] >= 0.5:
+            last_sent[0] = now
+            if os.path.exists(marker):
+                raise yt_dlp.utils.DownloadCancelled("cancelled")
+            _worker_queue.put((job_id, progress_fields(d)))
+
+    opts["progress_hooks"] = [*opts.get("progress_hooks", []), hook]
+    try:
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            info = _process(ydl, parsed)
+    except Exception as e:
+        # yt-dlp errors carry unpicklable exc_info; send back just the message
+        raise RuntimeError(str(e)[:500]) from None
+    finally:
+        try:
+            os.remove(marker)
+        except FileNotFoundError:
+            pass
+    if not info:
+        raise RuntimeError("yt-dlp returned no result (filtered by duration/size limits?)")
+    # A clipped download reports the section length on the requested download
+    downloads = info.get("requested_downloads") or [{}]
+    return {
+        "title": info.get("title"),
+        "duration": downloads[0].get("duration") or info.get("duration"),
+        "filepath": downloads[0].get("filepath"),
+    }
+
+
+def _drain(loop: asyncio.AbstractEventLoop, on_progress: Callable[..., None]) -> None:
+    while (item := _progress_queue.get()) is not None:
+        job_id, fields = item
+        loop.call_soon_threadsafe(functools.partial(on_progress, job_id, **fields))
+
+
+def start(on_progress: Callable[..., None]) -> None:
+    """Spawn and pre-warm the workers; ``on_progress(job_id, **fields)`` runs on the event loop."""
+    global _pool, _progress_queue, _drain_thread
+    if _pool is not None:
+        return
+    size = settings.YTDLP_POOL_SIZE or settings.YOUTUBE_CONCURRENCY
+    # spawn, not fork: the parent has an event loop and threads that must not be cloned
+    ctx = multiprocessing.get_context("spawn")
+    _progress_queue = ctx.Queue()
+    _pool = ProcessPoolExecutor(
+        max_workers=size, mp_context=ctx, initializer=_init_worker, initargs=(_progress_queue,),
+    )
+    for _ in range(size):
+        _pool.submit(_warm)
+    _drain_thread = threading.Thread(
+        target=_drain, args=(asyncio.get_running_loop(), on_progress), daemon=True,
+    )
+    _drain_thread.start()
+    shutil.rmtree(os.path.join(settings.TEMP_DIR, "pool-cancel"), ignore_errors=True)
+
+
+def stop() -> None:
+    global _pool, _progress_queue, _drain_thread
+    if _pool is None:
+        return
+    _pool.shutdown(wait=False, cancel_futures=True)
+    _progress_queue.put(None)
+    _drain_thread.join(timeout=5)
+    _pool = _progress_queue = _drain_thread = None
+
+
+async def download(
+    job_id: str, args: list[str], on_progress: Callable[..., None], timeout: Optional[float] = None,
+) -> dict:
+    """Run one job in the pool. On timeout or cancellation the worker is told to abort
+    at its next progress update rather than finishing a download nobody will use."""
+    start(on_progress)
+    loop = asyncio.get_running_loop()
+    try:
+        return await asyncio.wait_for(loop.run_in_executor(_pool, _download, job_id, args), timeout)
+    except (asyncio.CancelledError, asyncio.TimeoutError):
+        os.makedirs(os.path.dirname(_cancel_marker(job_id)), exist_ok=True)
+        open(_cancel_marker(job_id), "w").close()
+        raise
@@ -1,11 +1,16 @@
 import asyncio
 import os
+import time
+from typing import Optional
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from core.cleanup import cleanup_loop
-from core.job_store import get_job
-from models import JobResponse, JobStatus
+from core import metrics, procs, serving, ytdlp_pool
+from core.extractor import detach_follower
+from core.job_store import get_job, update_job
+from core.scheduler import scheduler
+from models import JobResponse, JobStatus, job_response
 from routes import youtube, upload, admin
 from config import settings
 
@@ -26,7 +31,13 @@ async def lifespan(app: FastAPI):
     os.makedirs(settings.TEMP_DIR, exist_ok=True)
     _write_cookies_file()
     task = asyncio.create_task(cleanup_loop())
+    if settings.YTDLP_ENGINE == "pool":
+        ytdlp_pool.start(update_job)   # pre-warm so the first job doesn't pay the yt_dlp import
+    await scheduler.start()
     yield
+    await scheduler.stop()
+    procs.kill_all()   # anything not owned by a scheduler job, e.g. a streaming upload's ffmpeg
+    ytdlp_pool.stop()
     task.cancel()
 
 
@@ -47,31 +58,107 @@ async def job_status(job_id: str) -> JobResponse:
     job = get_job(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="الوظيفة غير موجودة أو انتهت صلاحيتها")
-    return JobResponse(
-        job_id=job_id,
-        status=job["status"],
-        error=job.get("error"),
-        title=job.get("title"),
-        duration=job.get("duration"),
-        audio_url=f"/jobs/{job_id}/download" if job["status"] == JobStatus.done else None,
+    position = scheduler.position(job_id) if job["status"] == JobStatus.pending else None
+    return job_response(job_id, job, queue_position=position)
+
+
+@app.delete("/jobs/{job_id}", response_model=JobResponse)
+async def cancel_job(job_id: str) -> JobResponse:
+    """Cancel a pending or running job: its yt-dlp/ffmpeg process group is killed, partial
+    files are removed and the worker slot is freed. Finished jobs give 409."""
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="الوظيفة غير موجودة أو انتهت صلاحيتها")
+    if job["status"] not in (JobStatus.pending, JobStatus.processing):
+        raise HTTPException(status_code=409, detail=f"الوظيفة منتهية بالفعل ({job['status'].value})")
+    # Flag first: with several worker processes the one running the job sees it in the store
+    update_job(job_id, status=JobStatus.cancelled)
+    if not await scheduler.cancel(job_id):
+        detach_follower(job_id)
+    return job_response(job_id, get_job(job_id))
+
+
+_EVENTS_POLL_SECONDS = 0.5
+_EVENTS_KEEPALIVE_SECONDS = 15
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str) -> StreamingResponse:
+    """Server-Sent Events: a ``status`` event with the JobResponse on every change, until done/failed.
+
+    The job store is polled server-side (cheap, and works for jobs updated by any worker
+    process), so clients get pushed updates instead of polling /jobs/{job_id}.
+    """
+    if not get_job(job_id):
+        raise HTTPException(status_code=404, detail="الوظيفة غير موجودة أو انتهت صلاحيتها")
+
+    async def stream():
+        last, idle = None, 0.0
+        while True:
+            job = get_job(job_id)
+            if job is None:
+                yield "event: gone\ndata: {}\n\n"
+                return
+            position = scheduler.position(job_id) if job["status"] == JobStatus.pending else None
+            payload = job_response(job_id, job, queue_position=position).model_dump_json()
+            if payload != last:
+                last, idle = payload, 0.0
+                yield f"event: status\ndata: {payload}\n\n"
+            elif idle >= _EVENTS_KEEPALIVE_SECONDS:
+                idle = 0.0
+                yield ": keep-alive\n\n"
+            if job["status"] in (JobStatus.done, JobStatus.failed, JobStatus.cancelled):
+                return
+            await asyncio.sleep(_EVENTS_POLL_SECONDS)
+            idle += _EVENTS_POLL_SECONDS
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
+def _writer_state(job_id: str) -> str:
+    job = get_job(job_id)
+    if job is None:
+        return "gone"
+    return {JobStatus.processing: "writing", JobStatus.done: "done"}.get(job["status"], job["status"].value)
+
+
 @app.get("/jobs/{job_id}/download")
-async def download_audio(job_id: str) -> FileResponse:
+async def download_audio(job_id: str, request: Request, rendition: Optional[str] = None) -> Response:
+    """The result file, with Range (206), ETag/Last-Modified (304) and a per-format media type.
+    With STREAM_OUTPUT, a job still being encoded is streamed as it is written.
+    ``?rendition=<name>`` selects one of the outputs requested via ``renditions``."""
     job = get_job(job_id)
+    if rendition is None and job and job["status"] == JobStatus.processing and job.get("partial_path"):
+        # STREAM_OUTPUT: follow ffmpeg's output as it grows instead of waiting for the job
+        path = job["partial_path"]
+        return serving.follow_file(path, f"{job_id}{os.path.splitext(path)[1]}", lambda: _writer_state(job_id))
     if not job or job["status"] != JobStatus.done:
         raise HTTPException(status_code=404, detail="الملف غير متاح")
-    file_path = job["file_path"]
-    if not os.path.exists(file_path):
+    file_path, stem = job["file_path"], job_id
+    if rendition is not None:
+        file_path, stem = (job.get("renditions") or {}).get(rendition), f"{job_id}.{rendition}"
+        if file_path is None:
+            raise HTTPException(status_code=404, detail="rendition غير موجودة لهذه المهمة")
+    try:
+        response = serving.serve_file(request, file_path, f"{stem}{os.path.splitext(file_path)[1]}")
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="الملف غير موجود على القرص")
-    return FileResponse(
-        file_path,
-        media_type="audio/mpeg",
-        filename=f"{job_id}.mp3",
-    )
+    update_job(job_id, downloaded_at=time.time())   # recency for storage-quota eviction
+    return response
 
 
 @app.get("/health")
 async def health() -> dict:
     return {"status": "ok"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics() -> PlainTextResponse:
+    """Prometheus scrape target: stage latency histograms, job outcomes, queue depth,
+    subprocess counts and TEMP_DIR bytes. Per process when WORKERS > 1."""
+    body = await asyncio.to_thread(metrics.render, scheduler.stats())
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, HttpUrl
+from pydantic import BaseModel, Field, HttpUrl, field_validator
 from enum import Enum
-from typing import Optional
+from typing import Literal, Optional
 
 
 class JobStatus(str, Enum):
@@ -8,6 +8,7 @@ class JobStatus(str, Enum):
     processing = "processing"
     done       = "done"
     failed     = "failed"
+    cancelled  = "cancelled"
 
 
 class JobResponse(BaseModel):
@@ -17,9 +18,70 @@ class JobResponse(BaseModel):
     audio_url: Optional[str] = None   # متاح عند status=done
     duration:  Optional[float] = None # مدة الصوت بالثواني
     title:     Optional[str] = None   # عنوان الفيديو
+    queue_position: Optional[int] = None  # الترتيب في الطابور عند status=pending
+    progress:  Optional[float] = None # نسبة الإنجاز 0-100 عند status=processing
+    downloaded_bytes: Optional[int] = None
+    total_bytes:      Optional[int] = None
+    eta:       Optional[int] = None   # الثواني المتبقية المتوقعة
+    renditions: Optional[dict[str, str]] = None  # name -> رابط التنزيل عند status=done
+    stages:    Optional[dict[str, float]] = None  # stage -> unix time (queued, started, ..., finished)
+
+
+class Rendition(BaseModel):
+    name:    str = Field(pattern=r"^[a-z0-9_-]{1,32}$")
+    format:  Optional[Literal["mp3", "m4a", "aac", "opus", "ogg", "flac"]] = None  # الافتراضي AUDIO_FORMAT
+    bitrate: Optional[str] = Field(None, pattern=r"^\d{1,3}k$")                    # الافتراضي AUDIO_QUALITY
+
+
+def _unique_names(renditions: Optional[list[Rendition]]) -> Optional[list[Rendition]]:
+    if renditions and len({r.name for r in renditions}) != len(renditions):
+        raise ValueError("rendition names must be unique")
+    return renditions
 
 
 class YoutubeRequest(BaseModel):
     url:       HttpUrl
     start_sec: Optional[int] = None   # قص: من ثانية كذا
     end_sec:   Optional[int] = None   # قص: إلى ثانية كذا
+    priority:  int = 0                # الأعلى يُنفَّذ أولاً
+    renditions: Optional[list[Rendition]] = Field(None, min_length=1, max_length=4)  # عدة صيغ من فك ترميز واحد
+
+    _check_renditions = field_validator("renditions")(_unique_names)
+
+
+class BatchRequest(BaseModel):
+    items: list[YoutubeRequest] = Field(min_length=1)
+
+
+class BatchResponse(BaseModel):
+    batch_id: str
+    jobs:     list[JobResponse]       # بنفس ترتيب items — العناصر المكررة تشترك في job_id
+    counts:   dict[str, int]          # عدد الوظائف الفريدة لكل status
+
+
+def _downloadable(job: dict) -> bool:
+    # partial_path: STREAM_OUTPUT lets /download follow the file while it is being encoded
+    return job["status"] == JobStatus.done or (
+        job["status"] == JobStatus.processing and bool(job.get("partial_path"))
+    )
+
+
+def job_response(job_id: str, job: dict, **extra) -> JobResponse:
+    """Build the public view of a job record from the job store."""
+    return JobResponse(
+        job_id=job_id,
+        status=job["status"],
+        error=job.get("error"),
+        title=job.get("title"),
+        duration=job.get("duration"),
+        audio_url=f"/jobs/{job_id}/download" if _downloadable(job) else None,
+        progress=job.get("progress"),
+        downloaded_bytes=job.get("downloaded_bytes"),
+        total_bytes=job.get("total_bytes"),
+        eta=job.get("eta"),
+        stages=job.get("stages"),
+        renditions={
+            name: f"/jobs/{job_id}/download?rendition={name}" for name in job["renditions"]
+        } if job["status"] == JobStatus.done and job.get("renditions") else None,
+        **extra,
+    )
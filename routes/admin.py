@@ -5,6 +5,8 @@ from fastapi import APIRouter, Security, HTTPException
 from fastapi.security.api_key import APIKeyHeader
 from pydantic import BaseModel
 from config import settings
+from core import cache, storage
+from core.scheduler import scheduler
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=True)
@@ -38,7 +40,15 @@ async def refresh_cookies(body: CookiesBody, _=Security(verify_key)) -> dict:
 @router.delete("/cookies")
 async def clear_cookies(_=Security(verify_key)) -> dict:
     """Remove cookies to fall back to cookieless extraction."""
-    if settings.COOKIES_FILE and os.path.exists(settings.COOKIES_FILE):
-        os.remove(settings.COOKIES_FILE)
+    # Also drop the shared default file, which sibling worker processes fall back to
+    for path in {settings.COOKIES_FILE, os.path.join(settings.TEMP_DIR, "cookies.txt")}:
+        if path and os.path.exists(path):
+            os.remove(path)
     settings.COOKIES_FILE = ""
     return {"status": "ok", "message": "Cookies cleared"}
+
+
+@router.get("/stats")
+async def stats(_=Security(verify_key)) -> dict:
+    """Result-cache hit/miss counters, TEMP_DIR usage against the quota and worker-pool load."""
+    return {"cache": cache.stats(), "storage": storage.stats(), "scheduler": scheduler.stats()}
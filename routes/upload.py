@@ -1,12 +1,16 @@
 import os
 import aiofiles
 from pathlib import Path
-from fastapi import APIRouter, BackgroundTasks, Security, UploadFile, File, HTTPException
-from models import JobResponse
-from core.job_store import create_job
-from core.extractor import extract_video_file
+from typing import Optional
+from fastapi import APIRouter, Form, Request, Security, UploadFile, File, HTTPException
+from pydantic import TypeAdapter, ValidationError
+from models import JobResponse, Rendition, job_response
+from core.job_store import create_job, delete_job, get_job
+from core.extractor import extract_video_file, extract_video_stream, UploadTooLarge
+from core.scheduler import scheduler, QueueFullError
+from core import storage
 from config import settings
-from routes.youtube import verify_key
+from routes.youtube import verify_key, queue_full
 
 router = APIRouter(prefix="/extract", tags=["extract"])
 
@@ -17,15 +21,50 @@ ALLOWED_TYPES = {
     "video/x-matroska",
 }
 
+UPLOAD_CHUNK_BYTES = 1024 * 1024  # peak memory per upload is one chunk
+
+_renditions_adapter = TypeAdapter(list[Rendition])
+
+
+def _parse_renditions(raw: Optional[str]) -> list[dict] | None:
+    """The multipart ``renditions`` field: the same JSON list YoutubeRequest.renditions takes."""
+    if not raw:
+        return None
+    try:
+        renditions = _renditions_adapter.validate_json(raw)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+    if not 1 <= len(renditions) <= 4 or len({r.name for r in renditions}) != len(renditions):
+        raise HTTPException(status_code=422, detail="renditions: 1-4 entries with unique names")
+    return [r.model_dump() for r in renditions]
+
+
+def _reserve_or_507(job_id: str, nbytes: int) -> None:
+    try:
+        storage.reserve(job_id, nbytes)
+    except storage.StorageFullError as e:
+        raise HTTPException(status_code=507, detail=str(e))
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=400,
+        detail=f"حجم الملف يتجاوز {settings.MAX_FILE_SIZE_MB}MB",
+    )
+
 
 @router.post("/upload", response_model=JobResponse, status_code=202)
 async def submit_upload(
-    bg: BackgroundTasks,
     file: UploadFile = File(...),
+    renditions: Optional[str] = Form(None),   # JSON: [{"name": "preview", "bitrate": "64k"}, ...]
     _=Security(verify_key),
 ) -> JobResponse:
     if file.content_type not in ALLOWED_TYPES:
         raise HTTPException(status_code=400, detail="نوع الملف غير مدعوم")
+    rendition_list = _parse_renditions(renditions)
+    if scheduler.is_full():
+        # Reject before spending bandwidth and disk on a file we can't queue
+        raise queue_full(QueueFullError(scheduler.retry_after("transcode")))
 
     job_id = create_job()
     suffix = Path(file.filename or "video.mp4").suffix or ".mp4"
@@ -33,15 +72,69 @@ async def submit_upload(
     os.makedirs(settings.TEMP_DIR, exist_ok=True)
 
     max_bytes = settings.MAX_FILE_SIZE_MB * 1024 * 1024
-    content = await file.read(max_bytes + 1)
-    if len(content) > max_bytes:
-        raise HTTPException(
-            status_code=400,
-            detail=f"حجم الملف يتجاوز {settings.MAX_FILE_SIZE_MB}MB",
-        )
-
-    async with aiofiles.open(input_path, "wb") as f:
-        await f.write(content)
-
-    bg.add_task(extract_video_file, job_id, str(input_path))
-    return JobResponse(job_id=job_id, status="pending")
+    try:
+        if file.size is not None and file.size > max_bytes:
+            raise _too_large()
+        _reserve_or_507(job_id, file.size if file.size is not None else max_bytes)
+        written = 0
+        async with aiofiles.open(input_path, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise _too_large()
+                await f.write(chunk)
+    except BaseException:
+        if os.path.exists(input_path):
+            os.remove(input_path)
+        delete_job(job_id)
+        raise
+    finally:
+        storage.release(job_id)   # the input is on disk now; the transcode reserves its own output
+
+    try:
+        position = scheduler.submit("transcode", job_id, extract_video_file, str(input_path), rendition_list)
+    except QueueFullError as e:
+        os.remove(input_path)
+        delete_job(job_id)
+        raise queue_full(e)
+    return JobResponse(job_id=job_id, status="pending", queue_position=position)
+
+
+@router.post("/upload/stream", response_model=JobResponse)
+async def submit_upload_stream(
+    request: Request,
+    _=Security(verify_key),
+) -> JobResponse:
+    """Raw-body upload (Content-Type: video/...) transcoded while it arrives.
+
+    The response is sent once the audio is ready, so end-to-end latency is roughly
+    max(upload, transcode). The container must be streamable (webm, mkv, faststart mp4).
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type not in ALLOWED_TYPES:
+        raise HTTPException(status_code=400, detail="نوع الملف غير مدعوم")
+    max_bytes = settings.MAX_FILE_SIZE_MB * 1024 * 1024
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        raise _too_large()
+
+    job_id = create_job()
+    try:
+        _reserve_or_507(job_id, storage.expected_output_bytes(settings.AUDIO_CLIP_SECONDS))
+        async with scheduler.direct("transcode"):
+            # Tracked so DELETE /jobs/{id} can stop it; the response then reports "cancelled"
+            await scheduler.run_tracked(
+                "transcode", job_id, extract_video_stream(job_id, request.stream(), max_bytes),
+            )
+    except QueueFullError as e:
+        delete_job(job_id)
+        raise queue_full(e)
+    except UploadTooLarge:
+        delete_job(job_id)
+        raise _too_large()
+    except HTTPException:
+        delete_job(job_id)
+        raise
+    finally:
+        storage.release(job_id)
+    return job_response(job_id, get_job(job_id))
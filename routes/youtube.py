@@ -1,8 +1,10 @@
-from fastapi import APIRouter, BackgroundTasks, Security, HTTPException
+from fastapi import APIRouter, Security, HTTPException
 from fastapi.security.api_key import APIKeyHeader
-from models import YoutubeRequest, JobResponse
-from core.job_store import create_job, get_job
-from core.extractor import extract_youtube
+from models import BatchRequest, BatchResponse, JobStatus, YoutubeRequest, JobResponse, job_response
+from core.job_store import create_batch, create_job, delete_job, get_batch, get_job, update_job
+from core.extractor import attach_youtube, extract_youtube, preflight, youtube_flight_key
+from core.scheduler import scheduler, QueueFullError
+from core.video_info import VideoRejected
 from config import settings
 
 router = APIRouter(prefix="/extract", tags=["extract"])
@@ -14,12 +16,111 @@ def verify_key(key: str = Security(api_key_header)) -> None:
         raise HTTPException(status_code=403, detail="Forbidden")
 
 
+def queue_full(e: QueueFullError) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="الطابور ممتلئ، حاول لاحقاً",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def _renditions(req: YoutubeRequest) -> list[dict] | None:
+    # Plain dicts: they travel through the scheduler and into the job store
+    return [r.model_dump() for r in req.renditions] if req.renditions else None
+
+
 @router.post("/youtube", response_model=JobResponse, status_code=202)
 async def submit_youtube(
     req: YoutubeRequest,
-    bg: BackgroundTasks,
     _=Security(verify_key),
 ) -> JobResponse:
     job_id = create_job()
-    bg.add_task(extract_youtube, job_id, str(req.url), req.start_sec, req.end_sec)
-    return JobResponse(job_id=job_id, status="pending")
+    renditions = _renditions(req)
+    if attach_youtube(job_id, str(req.url), req.start_sec, req.end_sec, renditions):
+        return job_response(job_id, get_job(job_id))
+    title = None
+    if settings.PREFLIGHT:
+        # Reject what the download would fail on anyway before it takes a queue slot
+        try:
+            info = await preflight(str(req.url))
+        except VideoRejected as e:
+            delete_job(job_id)
+            raise HTTPException(status_code=422, detail=str(e))
+        if info:
+            title = info.get("title")
+            update_job(job_id, title=title)
+    try:
+        position = scheduler.submit(
+            "youtube", job_id, extract_youtube, str(req.url), req.start_sec, req.end_sec, renditions,
+            priority=req.priority,
+        )
+    except QueueFullError as e:
+        delete_job(job_id)
+        raise queue_full(e)
+    return JobResponse(job_id=job_id, status="pending", queue_position=position, title=title)
+
+
+def _job_view(job_id: str) -> JobResponse:
+    job = get_job(job_id)
+    if job is None:
+        return JobResponse(job_id=job_id, status=JobStatus.failed, error="انتهت صلاحية الوظيفة")
+    position = scheduler.position(job_id) if job["status"] == JobStatus.pending else None
+    return job_response(job_id, job, queue_position=position)
+
+
+def _batch_response(batch_id: str, job_ids: list[str]) -> BatchResponse:
+    views = {job_id: _job_view(job_id) for job_id in dict.fromkeys(job_ids)}
+    counts = {status.value: 0 for status in JobStatus}
+    for view in views.values():
+        counts[view.status.value] += 1
+    return BatchResponse(batch_id=batch_id, jobs=[views[j] for j in job_ids], counts=counts)
+
+
+@router.post("/youtube/batch", response_model=BatchResponse, status_code=202)
+async def submit_youtube_batch(
+    req: BatchRequest,
+    _=Security(verify_key),
+) -> BatchResponse:
+    """Submit many URLs at once. Identical items (same video and clip window) share one job;
+    the batch is admitted whole or rejected with 429, never half-queued."""
+    if len(req.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"الحد الأقصى {settings.BATCH_MAX_ITEMS} رابطاً في الطلب الواحد",
+        )
+
+    unique: dict[str, YoutubeRequest] = {}
+    item_keys = []
+    for item in req.items:
+        key = youtube_flight_key(str(item.url), item.start_sec, item.end_sec, _renditions(item))
+        item_keys.append(key)
+        if key not in unique or item.priority > unique[key].priority:
+            unique[key] = item
+
+    job_ids, to_queue = {}, []
+    for key, item in unique.items():
+        job_ids[key] = create_job()
+        if not attach_youtube(job_ids[key], str(item.url), item.start_sec, item.end_sec, _renditions(item)):
+            to_queue.append((job_ids[key], item))
+
+    if len(to_queue) > scheduler.room():
+        for job_id in job_ids.values():
+            delete_job(job_id)
+        raise queue_full(QueueFullError(scheduler.retry_after("youtube")))
+    # Same concurrency bound as single submissions: the youtube pool runs YOUTUBE_CONCURRENCY at a time
+    for job_id, item in to_queue:
+        scheduler.submit(
+            "youtube", job_id, extract_youtube, str(item.url), item.start_sec, item.end_sec, _renditions(item),
+            priority=item.priority,
+        )
+
+    ordered = [job_ids[key] for key in item_keys]
+    return _batch_response(create_batch(ordered), ordered)
+
+
+@router.get("/youtube/batch/{batch_id}", response_model=BatchResponse)
+async def batch_status(batch_id: str, _=Security(verify_key)) -> BatchResponse:
+    batch = get_batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="الدفعة غير موجودة أو انتهت صلاحيتها")
+    return _batch_response(batch_id, batch["job_ids"])
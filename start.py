@@ -27,8 +27,12 @@ else:
     with open("/app/pot-server-startup.log") as f:
         print(f.read()[:500])
 
-print(f"[start] Starting uvicorn on port {render_port}...")
+# WORKERS > 1 runs one event loop per core; job state then lives in SQLite (see config.py)
+workers = os.environ.get("WORKERS", "1")
+
+print(f"[start] Starting uvicorn on port {render_port} with {workers} worker(s)...")
 os.execvp(
     sys.executable,
-    [sys.executable, "-m", "uvicorn", "main:app", "--host", "0.0.0.0", "--port", render_port],
+    [sys.executable, "-m", "uvicorn", "main:app", "--host", "0.0.0.0", "--port", render_port,
+     "--workers", workers],
 )
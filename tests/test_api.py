@@ -21,6 +21,13 @@ HEADERS = {"X-API-Key": API_KEY}
 client = TestClient(app)
 
 
+@pytest.fixture(autouse=True)
+def _no_preflight(monkeypatch):
+    # Submissions would otherwise run the real yt-dlp for metadata before queueing
+    from config import settings
+    monkeypatch.setattr(settings, "PREFLIGHT", False)
+
+
 # ---------------------------------------------------------------------------
 # Health check
 # ---------------------------------------------------------------------------
@@ -199,6 +206,75 @@ def test_download_success(tmp_path):
     delete_job(job_id)
 
 
+def _done_job_with_file(tmp_path, name="test.mp3", data=bytes(range(256)) * 4):
+    path = tmp_path / name
+    path.write_bytes(data)
+    job_id = create_job()
+    update_job(job_id, status=JobStatus.done, file_path=str(path))
+    return job_id, data
+
+
+def test_download_byte_range(tmp_path):
+    job_id, data = _done_job_with_file(tmp_path)
+    res = client.get(f"/jobs/{job_id}/download", headers={"Range": "bytes=100-199"})
+    assert res.status_code == 206
+    assert res.content == data[100:200]
+    assert res.headers["content-range"] == f"bytes 100-199/{len(data)}"
+    assert res.headers["accept-ranges"] == "bytes"
+
+    res = client.get(f"/jobs/{job_id}/download", headers={"Range": "bytes=-24"})
+    assert res.status_code == 206
+    assert res.content == data[-24:]
+
+    res = client.get(f"/jobs/{job_id}/download", headers={"Range": f"bytes={len(data)}-"})
+    assert res.status_code == 416
+    assert res.headers["content-range"] == f"bytes */{len(data)}"
+    delete_job(job_id)
+
+
+def test_download_conditional_requests(tmp_path):
+    job_id, data = _done_job_with_file(tmp_path)
+    first = client.get(f"/jobs/{job_id}/download")
+    etag, last_modified = first.headers["etag"], first.headers["last-modified"]
+
+    res = client.get(f"/jobs/{job_id}/download", headers={"If-None-Match": etag})
+    assert res.status_code == 304
+    assert res.content == b""
+    res = client.get(f"/jobs/{job_id}/download", headers={"If-Modified-Since": last_modified})
+    assert res.status_code == 304
+
+    # A stale If-Range validator means the client gets the whole (new) file, not a slice
+    res = client.get(
+        f"/jobs/{job_id}/download",
+        headers={"Range": "bytes=0-9", "If-Range": '"stale"'},
+    )
+    assert res.status_code == 200
+    assert res.content == data
+    delete_job(job_id)
+
+
+def test_download_media_type_follows_file_format(tmp_path):
+    job_id, _ = _done_job_with_file(tmp_path, name="test.m4a")
+    res = client.get(f"/jobs/{job_id}/download")
+    assert res.headers["content-type"] == "audio/mp4"
+    assert res.headers["content-disposition"] == f'attachment; filename="{job_id}.m4a"'
+    delete_job(job_id)
+
+
+@pytest.mark.parametrize("header,expected", [
+    ("bytes=0-0", (0, 0)),
+    ("bytes=5-", (5, 9)),
+    ("bytes=5-500", (5, 9)),
+    ("bytes=-3", (7, 9)),
+    ("bytes=0-1,4-5", None),
+    ("items=0-1", None),
+    ("bytes=x-1", None),
+])
+def test_parse_range(header, expected):
+    from core.serving import parse_range
+    assert parse_range(header, 10) == expected
+
+
 # ---------------------------------------------------------------------------
 # Upload endpoint
 # ---------------------------------------------------------------------------
@@ -224,3 +300,1407 @@ def test_upload_valid_file():
     data = res.json()
     assert data["status"] == "pending"
     delete_job(data["job_id"])
+
+
+# ---------------------------------------------------------------------------
+# Result cache
+# ---------------------------------------------------------------------------
+
+@pytest.mark.parametrize("url", [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=42",
+    "https://youtu.be/dQw4w9WgXcQ?si=abc",
+    "https://m.youtube.com/shorts/dQw4w9WgXcQ",
+    "https://www.youtube.com/embed/dQw4w9WgXcQ",
+])
+def test_canonical_video_id(url):
+    from core.cache import canonical_video_id
+    assert canonical_video_id(url) == "dQw4w9WgXcQ"
+
+
+def test_canonical_video_id_rejects_other_hosts():
+    from core.cache import canonical_video_id
+    assert canonical_video_id("https://example.com/watch?v=dQw4w9WgXcQ") is None
+
+
+def test_youtube_cache_hit_skips_download(tmp_path, monkeypatch):
+    import asyncio
+    from config import settings
+    from core import cache
+    from core.extractor import extract_youtube, _clip_window
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    src = tmp_path / "seed.mp3"
+    src.write_bytes(b"\xff\xfb\x90\x00" * 10)
+    key = cache.youtube_cache_key("dQw4w9WgXcQ", _clip_window())
+    cache.store(key, src, title="Cached", duration=30.0)
+
+    job_id = create_job()
+    with patch("asyncio.create_subprocess_exec", side_effect=AssertionError("spawned")):
+        asyncio.run(extract_youtube(job_id, "https://youtu.be/dQw4w9WgXcQ"))
+    job = get_job(job_id)
+    assert job["status"] == JobStatus.done
+    assert job["title"] == "Cached"
+    assert open(job["file_path"], "rb").read() == src.read_bytes()
+    delete_job(job_id)
+
+
+def test_cache_evicts_least_recently_used(tmp_path, monkeypatch):
+    from config import settings
+    from core import cache
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "RESULT_CACHE_MAX_MB", 1)
+    for i, name in enumerate(["old", "new"]):
+        src = tmp_path / f"{name}.mp3"
+        src.write_bytes(b"\x00" * 700 * 1024)
+        cache.store(name, src)
+        os.utime(tmp_path / "cache" / f"{name}.mp3", (i, i))
+    cache.evict()
+    assert cache.lookup("old") is None
+    assert cache.lookup("new") is not None
+
+
+def test_admin_stats_reports_cache():
+    res = client.get("/admin/stats", headers=HEADERS)
+    assert res.status_code == 200
+    assert "hits" in res.json()["cache"]
+
+
+# ---------------------------------------------------------------------------
+# In-flight coalescing
+# ---------------------------------------------------------------------------
+
+def _fake_proc(stdout=b"", stderr=b"", returncode=0, on_exit=None, delay=0.05):
+    """A finished-on-wait() subprocess whose stdout/stderr are real StreamReaders."""
+    import asyncio
+
+    proc = MagicMock(returncode=None)
+    proc.stdout, proc.stderr = asyncio.StreamReader(), asyncio.StreamReader()
+
+    async def wait():
+        await asyncio.sleep(delay)
+        if on_exit:
+            on_exit()
+        proc.stderr.feed_data(stderr)   # ffmpeg prints its input banner before any progress
+        proc.stdout.feed_data(stdout)
+        proc.stdout.feed_eof()
+        proc.stderr.feed_eof()
+        proc.returncode = returncode
+        return returncode
+
+    proc.wait = wait
+    return proc
+
+
+def _fake_ytdlp(calls, returncode=0):
+    """Stand-in for create_subprocess_exec that 'downloads' into yt-dlp's --output path."""
+    async def fake_exec(*cmd, **kwargs):
+        calls.append(cmd)
+        out = cmd[cmd.index("--output") + 1].replace("%(ext)s", "mp3")
+
+        def write_output():
+            if returncode == 0:
+                with open(out, "wb") as f:
+                    f.write(b"\xff\xfb\x90\x00")
+
+        return _fake_proc(
+            stdout=b"E2A|title|Shared Title\nE2A|progress|500|1000|1\nE2A|duration|30.0\n",
+            stderr=b"boom",
+            returncode=returncode,
+            on_exit=write_output,
+        )
+
+    return fake_exec
+
+
+def test_concurrent_identical_jobs_share_one_download(tmp_path, monkeypatch):
+    import asyncio
+    from config import settings
+    from core.extractor import extract_youtube
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "NORMALIZE_MODE", "off")
+    monkeypatch.setattr(settings, "RESULT_CACHE_MAX_MB", 0)
+    calls = []
+    job_ids = [create_job() for _ in range(3)]
+
+    async def run_all():
+        await asyncio.gather(*(
+            extract_youtube(jid, "https://www.youtube.com/watch?v=dQw4w9WgXcQ") for jid in job_ids
+        ))
+
+    with patch("asyncio.create_subprocess_exec", _fake_ytdlp(calls)), \
+         patch("core.extractor._get_duration", AsyncMock(side_effect=AssertionError("probed"))):
+        asyncio.run(run_all())
+
+    assert len(calls) == 1
+    for jid in job_ids:
+        job = get_job(jid)
+        assert job["status"] == JobStatus.done
+        assert job["title"] == "Shared Title"
+        assert job["duration"] == 30.0
+        assert os.path.exists(job["file_path"])
+        delete_job(jid)
+
+
+def test_concurrent_identical_jobs_fail_together(tmp_path, monkeypatch):
+    import asyncio
+    from config import settings
+    from core.extractor import extract_youtube
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "NORMALIZE_MODE", "off")
+    calls = []
+    job_ids = [create_job() for _ in range(2)]
+
+    async def run_all():
+        await asyncio.gather(*(
+            extract_youtube(jid, "https://youtu.be/dQw4w9WgXcQ") for jid in job_ids
+        ))
+
+    with patch("asyncio.create_subprocess_exec", _fake_ytdlp(calls, returncode=1)):
+        asyncio.run(run_all())
+
+    assert len(calls) == 1
+    for jid in job_ids:
+        assert get_job(jid)["status"] == JobStatus.failed
+        assert get_job(jid)["error"] == "boom"
+        delete_job(jid)
+
+
+# ---------------------------------------------------------------------------
+# Scheduler
+# ---------------------------------------------------------------------------
+
+def test_scheduler_caps_concurrency_and_honours_priority(monkeypatch):
+    import asyncio
+    from config import settings
+    from core.scheduler import Scheduler
+
+    monkeypatch.setattr(settings, "TRANSCODE_CONCURRENCY", 2)
+    order, running, peak = [], [0], [0]
+
+    async def work(job_id):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        order.append(job_id)
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+
+    async def run():
+        sched = Scheduler()
+        for i in range(4):
+            sched.submit("transcode", f"low{i}", work)
+        sched.submit("transcode", "urgent", work, priority=5)
+        assert sched.position("urgent") == 1
+        await sched.start()
+        while sched.queued() or any(s["running"] for s in sched.stats().values()):
+            await asyncio.sleep(0.01)
+        await sched.stop()
+
+    asyncio.run(run())
+    assert peak[0] == 2
+    assert order[0] == "urgent"
+    assert order[1:] == ["low0", "low1", "low2", "low3"]
+
+
+def test_submit_youtube_reports_queue_position():
+    with patch("routes.youtube.extract_youtube", new_callable=AsyncMock):
+        res = client.post(
+            "/extract/youtube",
+            json={"url": "https://www.youtube.com/watch?v=queuePos001"},
+            headers=HEADERS,
+        )
+    assert res.status_code == 202
+    job_id = res.json()["job_id"]
+    assert res.json()["queue_position"] >= 1
+    assert client.get(f"/jobs/{job_id}").json()["queue_position"] >= 1
+    delete_job(job_id)
+
+
+def test_submit_youtube_queue_full_returns_429(monkeypatch):
+    from config import settings
+
+    monkeypatch.setattr(settings, "QUEUE_MAX_SIZE", 0)
+    res = client.post(
+        "/extract/youtube",
+        json={"url": "https://www.youtube.com/watch?v=queueFull01"},
+        headers=HEADERS,
+    )
+    assert res.status_code == 429
+    assert int(res.headers["Retry-After"]) >= 1
+
+
+def test_upload_queue_full_returns_429(monkeypatch):
+    from config import settings
+
+    monkeypatch.setattr(settings, "QUEUE_MAX_SIZE", 0)
+    res = client.post(
+        "/extract/upload",
+        files={"file": ("video.mp4", b"\x00" * 100, "video/mp4")},
+        headers=HEADERS,
+    )
+    assert res.status_code == 429
+
+
+def test_upload_too_large_is_rejected_and_cleaned_up(tmp_path, monkeypatch):
+    from config import settings
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "MAX_FILE_SIZE_MB", 1)
+    jobs_before = set(get_all_jobs())
+    res = client.post(
+        "/extract/upload",
+        files={"file": ("video.mp4", b"\x00" * (1024 * 1024 + 1), "video/mp4")},
+        headers=HEADERS,
+    )
+    assert res.status_code == 400
+    assert list(tmp_path.iterdir()) == []
+    assert set(get_all_jobs()) == jobs_before
+
+
+def test_upload_streams_file_to_disk(tmp_path, monkeypatch):
+    from config import settings
+    import routes.upload as upload_route
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(upload_route, "UPLOAD_CHUNK_BYTES", 64)
+    payload = bytes(range(256)) * 10
+    with patch("routes.upload.extract_video_file", new_callable=AsyncMock):
+        res = client.post(
+            "/extract/upload",
+            files={"file": ("video.mp4", payload, "video/mp4")},
+            headers=HEADERS,
+        )
+    assert res.status_code == 202
+    job_id = res.json()["job_id"]
+    assert (tmp_path / f"{job_id}_input.mp4").read_bytes() == payload
+    delete_job(job_id)
+
+
+# ---------------------------------------------------------------------------
+# Streaming upload (request body piped into ffmpeg)
+# ---------------------------------------------------------------------------
+
+def _fake_ffmpeg_stdin(received):
+    """Stand-in for create_subprocess_exec: an ffmpeg that records stdin and writes its output."""
+    async def fake_exec(*cmd, **kwargs):
+        assert cmd[cmd.index("-i") + 1] == "pipe:0"
+        proc = MagicMock(returncode=None)
+        proc.stdin.write = received.append
+        proc.stdin.drain = AsyncMock()
+        proc.stderr.read = AsyncMock(return_value=b"size=     480kB time=00:00:30.02 bitrate= 128.0kbits/s")
+
+        async def wait():
+            with open(cmd[-1], "wb") as f:
+                f.write(b"\xff\xfb\x90\x00")
+            proc.returncode = 0
+            return 0
+
+        proc.wait = wait
+        return proc
+
+    return fake_exec
+
+
+def test_upload_stream_transcodes_without_input_file(tmp_path, monkeypatch):
+    from config import settings
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    received = []
+    payload = b"\x1a\x45\xdf\xa3" * 4096
+    with TestClient(app) as c, \
+         patch("asyncio.create_subprocess_exec", _fake_ffmpeg_stdin(received)), \
+         patch("core.extractor._resolve_bin", lambda name: [name]), \
+         patch("core.extractor._get_duration", AsyncMock(side_effect=AssertionError("probed"))):
+        res = c.post(
+            "/extract/upload/stream",
+            content=payload,
+            headers={**HEADERS, "Content-Type": "video/webm"},
+        )
+    assert res.status_code == 200
+    data = res.json()
+    assert data["status"] == "done"
+    assert data["duration"] == 30.02
+    assert data["audio_url"] == f"/jobs/{data['job_id']}/download"
+    assert b"".join(received) == payload
+    assert not any("_input" in p.name for p in tmp_path.iterdir())
+    delete_job(data["job_id"])
+
+
+def test_upload_stream_rejects_wrong_content_type():
+    res = client.post(
+        "/extract/upload/stream",
+        content=b"hello",
+        headers={**HEADERS, "Content-Type": "text/plain"},
+    )
+    assert res.status_code == 400
+
+
+# ---------------------------------------------------------------------------
+# Job store backends
+# ---------------------------------------------------------------------------
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    from core.job_store import MemoryJobStore, SQLiteJobStore
+    if request.param == "memory":
+        return MemoryJobStore()
+    return SQLiteJobStore(str(tmp_path / "jobs.db"))
+
+
+def test_store_roundtrip(store):
+    store.create("a", {"status": JobStatus.pending, "created_at": 1.0, "title": None})
+    store.update("a", {"status": JobStatus.done, "title": "T"})
+    job = store.get("a")
+    assert job["status"] == JobStatus.done
+    assert job["title"] == "T"
+    assert "a" in store.all()
+    store.delete("a")
+    assert store.get("a") is None
+
+
+def test_store_pop_expired_uses_created_at(store):
+    for job_id, created_at in [("old", 1.0), ("mid", 5.0), ("new", 10.0)]:
+        store.create(job_id, {"status": JobStatus.pending, "created_at": created_at})
+    store.delete("mid")
+    expired = store.pop_expired(6.0)
+    assert [job_id for job_id, _ in expired] == ["old"]
+    assert store.get("old") is None
+    assert store.get("new") is not None
+
+
+def test_sqlite_store_survives_reopen(tmp_path):
+    from core.job_store import SQLiteJobStore
+    path = str(tmp_path / "jobs.db")
+    SQLiteJobStore(path).create("persisted", {"status": JobStatus.done, "created_at": 1.0})
+    assert SQLiteJobStore(path).get("persisted")["status"] == JobStatus.done
+
+
+# ---------------------------------------------------------------------------
+# Multi-worker coordination
+# ---------------------------------------------------------------------------
+
+def test_file_lock_is_exclusive(tmp_path):
+    from core import locks
+    path = str(tmp_path / "slots" / "k.lock")
+    fd = locks.try_lock(path)
+    assert fd is not None
+    assert locks.try_lock(path) is None
+    locks.unlock(fd)
+    fd = locks.try_lock(path)
+    assert fd is not None
+    locks.unlock(fd)
+
+
+def test_host_slots_cap_direct_work_across_processes(tmp_path, monkeypatch):
+    import asyncio
+    from config import settings
+    from core import locks
+    from core.scheduler import Scheduler, QueueFullError, _slot_path
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "WORKERS", 2)
+    monkeypatch.setattr(settings, "TRANSCODE_CONCURRENCY", 1)
+    sibling = locks.try_lock(_slot_path("transcode", 0))   # another worker process holds the only slot
+
+    async def run():
+        sched = Scheduler()
+        await sched.start()
+        try:
+            with pytest.raises(QueueFullError):
+                async with sched.direct("transcode"):
+                    pass
+            locks.unlock(sibling)
+            async with sched.direct("transcode"):
+                assert sched.stats()["transcode"]["running"] == 1
+        finally:
+            await sched.stop()
+
+    asyncio.run(run())
+
+
+def test_cookies_fall_back_to_shared_file(tmp_path, monkeypatch):
+    from config import settings
+    from core.extractor import _cookies_file
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "COOKIES_FILE", "")
+    assert _cookies_file() is None
+    (tmp_path / "cookies.txt").write_text("# Netscape HTTP Cookie File\n")
+    assert _cookies_file() == str(tmp_path / "cookies.txt")
+
+
+# ---------------------------------------------------------------------------
+# Expiry
+# ---------------------------------------------------------------------------
+
+def test_store_oldest_created_at_skips_deleted(store):
+    assert store.oldest_created_at() is None
+    store.create("a", {"status": JobStatus.pending, "created_at": 1.0})
+    store.create("b", {"status": JobStatus.pending, "created_at": 2.0})
+    store.delete("a")
+    assert store.oldest_created_at() == 2.0
+
+
+def test_cleanup_loop_expires_job_at_its_ttl(tmp_path, monkeypatch):
+    import asyncio
+    from config import settings
+    from core.cleanup import cleanup_loop
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "JOB_TTL_SECONDS", 0.3)
+    job_id = create_job()
+    audio = tmp_path / f"{job_id}.mp3"
+    audio.write_bytes(b"\x00")
+    update_job(job_id, status=JobStatus.done, file_path=str(audio))
+
+    async def run():
+        task = asyncio.create_task(cleanup_loop())
+        await asyncio.sleep(0.1)
+        assert get_job(job_id) is not None
+        await asyncio.sleep(0.5)
+        task.cancel()
+
+    asyncio.run(run())
+    assert get_job(job_id) is None
+    assert not audio.exists()
+
+
+def test_reconcile_orphans_keeps_live_jobs(tmp_path, monkeypatch):
+    from config import settings
+    from core.cleanup import reconcile_orphans
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    live = create_job()
+    (tmp_path / f"{live}.mp3").write_bytes(b"\x00")
+    orphan = tmp_path / "00000000-0000-4000-8000-000000000000_input.mp4"
+    orphan.write_bytes(b"\x00")
+    (tmp_path / "cookies.txt").write_text("")
+    assert reconcile_orphans() == 1
+    assert not orphan.exists()
+    assert (tmp_path / f"{live}.mp3").exists()
+    assert (tmp_path / "cookies.txt").exists()
+    delete_job(live)
+
+
+# ---------------------------------------------------------------------------
+# Storage quota
+# ---------------------------------------------------------------------------
+
+def test_storage_usage_counts_hard_links_once(tmp_path, monkeypatch):
+    from config import settings
+    from core import cache, storage
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    job_file = tmp_path / "00000000-0000-4000-8000-000000000001.mp3"
+    job_file.write_bytes(b"\x00" * 1000)
+    (tmp_path / "00000000-0000-4000-8000-000000000002_input.mp4").write_bytes(b"\x00" * 300)
+    cache.store("k", job_file)
+    usage = storage.usage()
+    assert usage["inputs"] == 300
+    sidecar = (tmp_path / "cache" / "k.json").stat().st_size
+    assert usage["outputs"] + usage["cache"] == 1000 + sidecar
+    assert usage["total"] == 1300 + sidecar
+
+
+def test_storage_reserve_evicts_least_recently_downloaded(tmp_path, monkeypatch):
+    from config import settings
+    from core import storage
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "STORAGE_QUOTA_MB", 1)
+    jobs = {}
+    for name, downloaded_at in [("stale", 1.0), ("fresh", 2.0)]:
+        job_id = create_job()
+        path = tmp_path / f"{job_id}.mp3"
+        path.write_bytes(b"\x00" * 400 * 1024)
+        update_job(job_id, status=JobStatus.done, file_path=str(path), downloaded_at=downloaded_at)
+        jobs[name] = job_id
+
+    storage.reserve("incoming", 400 * 1024)
+    storage.release("incoming")
+    assert get_job(jobs["stale"])["status"] == JobStatus.failed
+    assert get_job(jobs["fresh"])["status"] == JobStatus.done
+    for job_id in jobs.values():
+        delete_job(job_id)
+
+
+def test_storage_reserve_raises_when_nothing_evictable(tmp_path, monkeypatch):
+    from config import settings
+    from core import storage
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "STORAGE_QUOTA_MB", 1)
+    with pytest.raises(storage.StorageFullError):
+        storage.reserve("huge", 2 * 1024 * 1024)
+
+
+def test_upload_over_quota_returns_507(tmp_path, monkeypatch):
+    from config import settings
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "STORAGE_QUOTA_MB", 1)
+    monkeypatch.setattr(settings, "MAX_FILE_SIZE_MB", 5)
+    res = client.post(
+        "/extract/upload",
+        files={"file": ("video.mp4", b"\x00" * (2 * 1024 * 1024), "video/mp4")},
+        headers=HEADERS,
+    )
+    assert res.status_code == 507
+    assert list(tmp_path.iterdir()) == []
+
+
+# ---------------------------------------------------------------------------
+# Duration without ffprobe
+# ---------------------------------------------------------------------------
+
+def test_ffmpeg_output_seconds_uses_last_progress_line():
+    from core.extractor import _ffmpeg_output_seconds
+    stderr = (
+        b"size=     128kB time=00:00:08.00 bitrate= 128.0kbits/s speed=16x\r"
+        b"size=     469kB time=00:01:30.05 bitrate= 128.0kbits/s speed=17x\n"
+        b"video:0kB audio:469kB subtitle:0kB"
+    )
+    assert _ffmpeg_output_seconds(stderr) == 90.05
+    assert _ffmpeg_output_seconds(b"Invalid data found when processing input") is None
+
+
+def test_parse_ytdlp_meta_ignores_other_output():
+    from core.extractor import _parse_ytdlp_meta, _to_seconds
+    meta = _parse_ytdlp_meta(b"[youtube] x: Downloading\nE2A|title|A | B\nE2A|duration|NA\n")
+    assert meta["title"] == "A | B"
+    assert _to_seconds(meta["duration"]) is None
+
+
+# ---------------------------------------------------------------------------
+# In-process yt-dlp engine
+# ---------------------------------------------------------------------------
+
+def test_ytdlp_args_parse_to_equivalent_api_options():
+    import yt_dlp
+    from core.extractor import _ytdlp_args
+
+    parsed = yt_dlp.parse_options(_ytdlp_args("job", "https://youtu.be/dQw4w9WgXcQ", (10, 40)))
+    opts = parsed.ydl_opts
+    assert parsed.urls == ["https://youtu.be/dQw4w9WgXcQ"]
+    assert opts["postprocessors"][0]["key"] == "FFmpegExtractAudio"
+    assert opts["noplaylist"] is True
+    assert list(opts["download_ranges"].ranges) == [[10, 40]]
+
+
+def test_progress_fields_from_hook_payload():
+    from core.ytdlp_pool import progress_fields
+    fields = progress_fields({"status": "downloading", "downloaded_bytes": 250, "total_bytes": 1000, "eta": 3})
+    assert fields == {"progress": 25.0, "downloaded_bytes": 250, "total_bytes": 1000, "eta": 3}
+    assert progress_fields({"downloaded_bytes": 10})["progress"] is None
+
+
+def test_pool_engine_is_used_when_configured(tmp_path, monkeypatch):
+    import asyncio
+    from config import settings
+    from core.extractor import extract_youtube
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "NORMALIZE_MODE", "off")
+    monkeypatch.setattr(settings, "YTDLP_ENGINE", "pool")
+    monkeypatch.setattr(settings, "RESULT_CACHE_MAX_MB", 0)
+
+    async def fake_download(job_id, args, on_progress, timeout=None):
+        on_progress(job_id, eta=7)
+        (tmp_path / f"{job_id}.mp3").write_bytes(b"\xff\xfb\x90\x00")
+        return {"title": "Pooled", "duration": 30.0}
+
+    job_id = create_job()
+    with patch("core.ytdlp_pool.download", fake_download), \
+         patch("asyncio.create_subprocess_exec", side_effect=AssertionError("spawned")):
+        asyncio.run(extract_youtube(job_id, "https://youtu.be/poolEngine1"))
+    job = get_job(job_id)
+    assert job["status"] == JobStatus.done
+    assert job["title"] == "Pooled"
+    assert job["eta"] == 7
+    delete_job(job_id)
+
+
+# ---------------------------------------------------------------------------
+# Progress and server-sent events
+# ---------------------------------------------------------------------------
+
+def test_job_status_reports_progress():
+    job_id = create_job()
+    update_job(job_id, status=JobStatus.processing, progress=42.5, eta=12)
+    data = client.get(f"/jobs/{job_id}").json()
+    assert data["progress"] == 42.5
+    assert data["eta"] == 12
+    delete_job(job_id)
+
+
+def test_job_events_not_found():
+    assert client.get("/jobs/nonexistent/events").status_code == 404
+
+
+def test_job_events_streams_until_done(monkeypatch):
+    import json
+    import threading
+    import main
+
+    monkeypatch.setattr(main, "_EVENTS_POLL_SECONDS", 0.05)
+    job_id = create_job()
+    update_job(job_id, status=JobStatus.processing, progress=10.0)
+
+    def finish():
+        update_job(job_id, progress=60.0)
+        threading.Timer(0.2, update_job, [job_id], {"status": JobStatus.done, "progress": 100.0}).start()
+
+    threading.Timer(0.2, finish).start()
+    res = client.get(f"/jobs/{job_id}/events")
+    assert res.headers["content-type"].startswith("text/event-stream")
+    events = [
+        json.loads(line[len("data: "):])
+        for line in res.text.splitlines() if line.startswith("data: ")
+    ]
+    assert [e["progress"] for e in events] == [10.0, 60.0, 100.0]
+    assert events[-1]["status"] == "done"
+    delete_job(job_id)
+
+
+def test_upload_transcode_reports_ffmpeg_progress(tmp_path, monkeypatch):
+    import asyncio
+    from config import settings
+    from core.extractor import extract_video_file
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "NORMALIZE_MODE", "loudnorm")
+    monkeypatch.setattr(settings, "AUDIO_CLIP_SECONDS", 0)
+    input_path = tmp_path / "in.mp4"
+    input_path.write_bytes(b"\x00")
+    seen = []
+
+    async def fake_exec(*cmd, **kwargs):
+        assert "-progress" in cmd
+        return _fake_proc(
+            stdout=b"out_time_us=5000000\nprogress=continue\nout_time_us=10000000\nprogress=end\n",
+            stderr=b"  Duration: 00:00:10.00, start: 0.000000, bitrate: 1000 kb/s\n",
+        )
+
+    job_id = create_job()
+    with patch("asyncio.create_subprocess_exec", fake_exec), \
+         patch("core.extractor._resolve_bin", lambda name: [name]), \
+         patch("core.extractor._PROGRESS_INTERVAL", 0), \
+         patch("core.extractor.update_job", side_effect=lambda j, **f: (seen.append(f), update_job(j, **f))):
+        asyncio.run(extract_video_file(job_id, str(input_path)))
+    assert [f["progress"] for f in seen if "progress" in f] == [50.0, 100.0, 100.0]
+    assert get_job(job_id)["duration"] == 10.0
+    delete_job(job_id)
+
+
+# ---------------------------------------------------------------------------
+# Batch submission
+# ---------------------------------------------------------------------------
+
+def test_batch_dedupes_identical_items_and_reports_status():
+    items = [
+        {"url": "https://www.youtube.com/watch?v=batchItem01"},
+        {"url": "https://youtu.be/batchItem01"},
+        {"url": "https://www.youtube.com/watch?v=batchItem01", "start_sec": 0, "end_sec": 10},
+    ]
+    with patch("routes.youtube.extract_youtube", new_callable=AsyncMock):
+        res = client.post("/extract/youtube/batch", json={"items": items}, headers=HEADERS)
+    assert res.status_code == 202
+    data = res.json()
+    job_ids = [job["job_id"] for job in data["jobs"]]
+    assert job_ids[0] == job_ids[1] != job_ids[2]
+    assert data["counts"]["pending"] == 2
+
+    update_job(job_ids[0], status=JobStatus.done, file_path="/tmp/x.mp3")
+    status = client.get(f"/extract/youtube/batch/{data['batch_id']}", headers=HEADERS).json()
+    assert [job["status"] for job in status["jobs"]] == ["done", "done", "pending"]
+    assert status["counts"] == {"pending": 1, "processing": 0, "done": 1, "failed": 0, "cancelled": 0}
+    for job_id in set(job_ids):
+        delete_job(job_id)
+
+
+def test_batch_is_rejected_whole_when_queue_lacks_room(monkeypatch):
+    from core.scheduler import scheduler
+
+    monkeypatch.setattr(scheduler, "room", lambda: 1)
+    before = len(get_all_jobs())
+    res = client.post(
+        "/extract/youtube/batch",
+        json={"items": [
+            {"url": "https://www.youtube.com/watch?v=batchFull01"},
+            {"url": "https://www.youtube.com/watch?v=batchFull02"},
+        ]},
+        headers=HEADERS,
+    )
+    assert res.status_code == 429
+    assert "Retry-After" in res.headers
+    assert len(get_all_jobs()) == before
+
+
+def test_batch_limits_item_count(monkeypatch):
+    from config import settings
+
+    monkeypatch.setattr(settings, "BATCH_MAX_ITEMS", 1)
+    items = [{"url": "https://www.youtube.com/watch?v=batchLimit1"}] * 2
+    res = client.post("/extract/youtube/batch", json={"items": items}, headers=HEADERS)
+    assert res.status_code == 422
+
+
+def test_batch_status_requires_key_and_existing_batch():
+    assert client.get("/extract/youtube/batch/nope").status_code == 403
+    assert client.get("/extract/youtube/batch/nope", headers=HEADERS).status_code == 404
+
+
+def test_store_batches_expire_with_jobs(store):
+    store.create_batch("b", {"created_at": 1.0, "job_ids": ["a", "a"]})
+    assert store.get_batch("b")["job_ids"] == ["a", "a"]
+    store.pop_expired(before=2.0)
+    assert store.get_batch("b") is None
+
+
+# ---------------------------------------------------------------------------
+# Streaming output while encoding
+# ---------------------------------------------------------------------------
+
+def test_download_follows_file_while_job_is_processing(tmp_path, monkeypatch):
+    import threading
+    from core import serving
+
+    monkeypatch.setattr(serving, "FOLLOW_POLL_SECONDS", 0.02)
+    path = tmp_path / "growing.mp3"
+    path.write_bytes(b"first-")
+    job_id = create_job()
+    update_job(job_id, status=JobStatus.processing, partial_path=str(path))
+    assert client.get(f"/jobs/{job_id}").json()["audio_url"] == f"/jobs/{job_id}/download"
+
+    def produce():
+        with open(path, "ab") as f:
+            f.write(b"second-")
+        threading.Timer(0.1, finish).start()
+
+    def finish():
+        with open(path, "ab") as f:
+            f.write(b"last")
+        update_job(job_id, status=JobStatus.done, file_path=str(path))
+
+    threading.Timer(0.1, produce).start()
+    res = client.get(f"/jobs/{job_id}/download")
+    assert res.status_code == 200
+    assert res.content == b"first-second-last"
+    assert "content-length" not in res.headers
+    delete_job(job_id)
+
+
+def test_download_follow_aborts_when_job_fails(tmp_path, monkeypatch):
+    import threading
+    from core import serving
+
+    monkeypatch.setattr(serving, "FOLLOW_POLL_SECONDS", 0.02)
+    path = tmp_path / "broken.mp3"
+    path.write_bytes(b"partial")
+    job_id = create_job()
+    update_job(job_id, status=JobStatus.processing, partial_path=str(path))
+    threading.Timer(0.1, update_job, [job_id], {"status": JobStatus.failed, "error": "boom"}).start()
+    # The app raises mid-body so the server drops the connection; TestClient surfaces the error
+    with pytest.raises(Exception) as excinfo:
+        client.get(f"/jobs/{job_id}/download")
+    assert "WriterFailed" in excinfo.exconly() or excinfo.group_contains(serving.WriterFailed, depth=None)
+    delete_job(job_id)
+
+
+def test_stream_output_pipes_ytdlp_into_ffmpeg(tmp_path, monkeypatch):
+    import asyncio
+    from config import settings
+    from core.extractor import extract_youtube
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "STREAM_OUTPUT", True)
+    monkeypatch.setattr(settings, "RESULT_CACHE_MAX_MB", 0)
+    calls = []
+
+    async def fake_exec(*cmd, **kwargs):
+        calls.append(cmd)
+        if "yt-dlp" in cmd[0]:
+            assert cmd[cmd.index("--output") + 1] == "-"
+            os.write(kwargs["stdout"], b"raw-audio")
+            return _fake_proc(stderr=b"E2A|title|Live Title\nE2A|progress|5|10|1\nE2A|duration|600\n")
+        received = os.read(kwargs["stdin"], 100)
+        assert cmd[cmd.index("-i") + 1] == "pipe:0"
+        assert "-write_xing" in cmd
+        with open(cmd[-1], "wb") as f:
+            f.write(b"encoded:" + received)
+        return _fake_proc(stderr=b"size=1kB time=00:00:30.00 bitrate=128k\n")
+
+    job_id = create_job()
+    with patch("asyncio.create_subprocess_exec", fake_exec), \
+         patch("core.extractor._resolve_bin", lambda name: [name]):
+        asyncio.run(extract_youtube(job_id, "https://www.youtube.com/watch?v=streamOut01"))
+    job = get_job(job_id)
+    assert job["status"] == JobStatus.done, job["error"]
+    assert job["partial_path"] == job["file_path"]
+    assert open(job["file_path"], "rb").read() == b"encoded:raw-audio"
+    assert job["title"] == "Live Title"
+    assert job["duration"] == 30.0
+    assert len(calls) == 2
+    delete_job(job_id)
+
+
+# ---------------------------------------------------------------------------
+# Clip-aware fetch
+# ---------------------------------------------------------------------------
+
+def test_clip_fetch_seeks_into_resolved_audio_url(tmp_path, monkeypatch):
+    import asyncio
+    from config import settings
+    from core.extractor import extract_youtube
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "CLIP_FETCH", True)
+    monkeypatch.setattr(settings, "COOKIES_FILE", "")
+    monkeypatch.setattr(settings, "PROXY", "")
+    monkeypatch.setattr(settings, "RESULT_CACHE_MAX_MB", 0)
+    calls = []
+
+    async def fake_exec(*cmd, **kwargs):
+        calls.append(cmd)
+        if "yt-dlp" in cmd[0]:
+            assert "--download-sections" not in cmd
+            return _fake_proc(stdout=(
+                b"E2A|title|Clip Title\n"
+                b"E2A|url|https://media.example/audio.webm?sig=1\n"
+                b'E2A|headers|{"User-Agent": "UA/1"}\n'
+            ))
+        # Seek and duration are input options, so ffmpeg range-fetches only the segment
+        assert cmd[cmd.index("-ss") + 1] == "60"
+        assert cmd[cmd.index("-t") + 1] == "30"
+        assert cmd.index("-ss") < cmd.index("-i")
+        assert cmd[cmd.index("-i") + 1] == "https://media.example/audio.webm?sig=1"
+        assert cmd[cmd.index("-headers") + 1] == "User-Agent: UA/1\r\n"
+        with open(cmd[-1], "wb") as f:
+            f.write(b"\xff\xfb\x90\x00")
+        return _fake_proc(stdout=b"out_time_us=15000000\nout_time_us=30000000\nprogress=end\n")
+
+    job_id = create_job()
+    with patch("asyncio.create_subprocess_exec", fake_exec), \
+         patch("core.extractor._resolve_bin", lambda name: [name]):
+        asyncio.run(extract_youtube(job_id, "https://www.youtube.com/watch?v=clipFetch01", 60, 90))
+    job = get_job(job_id)
+    assert job["status"] == JobStatus.done, job["error"]
+    assert job["title"] == "Clip Title"
+    assert job["duration"] == 30.0
+    assert len(calls) == 2
+    delete_job(job_id)
+
+
+def test_clip_fetch_falls_back_when_cookies_are_needed(tmp_path, monkeypatch):
+    from config import settings
+    from core.extractor import _clip_fetch_supported
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "PROXY", "")
+    monkeypatch.setattr(settings, "COOKIES_FILE", "")
+    assert _clip_fetch_supported()
+    cookies = tmp_path / "cookies.txt"
+    cookies.write_text("# Netscape HTTP Cookie File\n")
+    monkeypatch.setattr(settings, "COOKIES_FILE", str(cookies))
+    assert not _clip_fetch_supported()
+    monkeypatch.setattr(settings, "COOKIES_FILE", "")
+    cookies.unlink()
+    monkeypatch.setattr(settings, "PROXY", "socks5://127.0.0.1:1080")
+    assert not _clip_fetch_supported()
+
+
+# ---------------------------------------------------------------------------
+# Stream-copy fast path
+# ---------------------------------------------------------------------------
+
+@pytest.mark.parametrize("source,expect_copy", [("aac", True), ("opus", False), (None, False)])
+def test_upload_remuxes_when_source_codec_matches(tmp_path, monkeypatch, source, expect_copy):
+    import asyncio
+    from config import settings
+    from core.extractor import extract_video_file
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "NORMALIZE_MODE", "off")
+    monkeypatch.setattr(settings, "AUDIO_FORMAT", "m4a")
+    monkeypatch.setattr(settings, "STREAM_COPY", True)
+    input_path = tmp_path / "in.mp4"
+    input_path.write_bytes(b"\x00")
+    ffmpeg_cmds = []
+
+    async def fake_exec(*cmd, **kwargs):
+        if cmd[0] == "ffprobe":
+            proc = MagicMock(returncode=0)
+            proc.communicate = AsyncMock(return_value=((source or "").encode() + b"\n", b""))
+            return proc
+        ffmpeg_cmds.append(cmd)
+        return _fake_proc(stdout=b"out_time_us=30000000\nprogress=end\n")
+
+    job_id = create_job()
+    with patch("asyncio.create_subprocess_exec", fake_exec), \
+         patch("core.extractor._resolve_bin", lambda name: [name]):
+        asyncio.run(extract_video_file(job_id, str(input_path)))
+    assert get_job(job_id)["status"] == JobStatus.done
+    (cmd,) = ffmpeg_cmds
+    assert cmd[-1].endswith(".m4a")
+    if expect_copy:
+        assert cmd[cmd.index("-c:a") + 1] == "copy"
+        assert "-af" not in cmd
+    else:
+        assert cmd[cmd.index("-acodec") + 1] == "aac"
+    delete_job(job_id)
+
+
+def test_ytdlp_prefers_source_in_target_codec(monkeypatch):
+    from config import settings
+    from core.extractor import _can_copy, _ytdlp_args
+
+    monkeypatch.setattr(settings, "STREAM_COPY", True)
+    monkeypatch.setattr(settings, "NORMALIZE_MODE", "off")
+    monkeypatch.setattr(settings, "AUDIO_FORMAT", "m4a")
+    args = _ytdlp_args("job", "https://www.youtube.com/watch?v=copyPath01", None)
+    assert args[args.index("--format") + 1].startswith("bestaudio[acodec^=mp4a]")
+    assert _can_copy("mp4a.40.2")
+    assert not _can_copy("opus")
+
+    monkeypatch.setattr(settings, "STREAM_COPY", False)
+    args = _ytdlp_args("job", "https://www.youtube.com/watch?v=copyPath01", None)
+    assert args[args.index("--format") + 1] == "bestaudio/best"
+    assert not _can_copy("mp4a.40.2")
+
+
+# ---------------------------------------------------------------------------
+# Loudness normalisation
+# ---------------------------------------------------------------------------
+
+_EBUR128_SUMMARY = b"""[Parsed_ebur128_0 @ 0x1] Summary:
+
+  Integrated loudness:
+    I:         -23.0 LUFS
+    Threshold: -33.2 LUFS
+
+  Sample peak:
+    Peak:       -9.5 dBFS
+"""
+
+
+def test_gain_mode_measures_youtube_source_once(tmp_path, monkeypatch):
+    import asyncio
+    from config import settings
+    from core.extractor import extract_youtube
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "NORMALIZE_MODE", "gain")
+    monkeypatch.setattr(settings, "RESULT_CACHE_MAX_MB", 0)
+    monkeypatch.setattr(settings, "CLIP_FETCH", False)
+    monkeypatch.setattr(settings, "STREAM_OUTPUT", False)
+    measured, encodes = [], []
+
+    async def fake_exec(*cmd, **kwargs):
+        if "yt-dlp" in cmd[0]:
+            assert "--extract-audio" not in cmd
+            source = cmd[cmd.index("--output") + 1].replace("%(ext)s", "webm")
+            with open(source, "wb") as f:
+                f.write(b"source")
+            return _fake_proc(stdout=f"E2A|title|Loud\nE2A|filepath|{source}\n".encode())
+        if any("ebur128" in a for a in cmd):
+            measured.append(cmd)
+            proc = MagicMock(returncode=0)
+            proc.communicate = AsyncMock(return_value=(b"", _EBUR128_SUMMARY))
+            return proc
+        encodes.append(cmd)
+        with open(cmd[-1], "wb") as f:
+            f.write(b"encoded")
+        return _fake_proc(stdout=b"out_time_us=30000000\nprogress=end\n")
+
+    with patch("asyncio.create_subprocess_exec", fake_exec), \
+         patch("core.extractor._resolve_bin", lambda name: [name]):
+        for _ in range(2):
+            job_id = create_job()
+            asyncio.run(extract_youtube(job_id, "https://www.youtube.com/watch?v=loudGain001"))
+            job = get_job(job_id)
+            assert job["status"] == JobStatus.done, job["error"]
+            assert not list(tmp_path.glob(f"{job_id}_input.*"))
+            delete_job(job_id)
+
+    # -16 LUFS target is +7 dB, but the -1.5 dBFS peak ceiling allows only +8 — so +7
+    assert [cmd[cmd.index("-af") + 1] for cmd in encodes] == ["volume=7.0dB"] * 2
+    assert len(measured) == 1
+
+
+@pytest.mark.parametrize("integrated,peak,expected", [
+    (-23.0, -9.5, 7.0),      # loudness-limited
+    (-30.0, -3.0, 1.5),      # peak-limited
+    (-8.0, -0.1, -8.0),      # too loud: turned down
+    (-70.0, None, 20.0),     # near silence: capped
+])
+def test_gain_db(integrated, peak, expected):
+    from core import loudness
+    assert loudness.gain_db({"integrated": integrated, "peak": peak}) == expected
+
+
+def test_normalize_filter_per_mode(monkeypatch):
+    from config import settings
+    from core import loudness
+
+    assert loudness.parse_ebur128(_EBUR128_SUMMARY.decode()) == {"integrated": -23.0, "peak": -9.5}
+    monkeypatch.setattr(settings, "NORMALIZE_MODE", "off")
+    assert loudness.filter_args({"integrated": -23.0, "peak": None}) == []
+    monkeypatch.setattr(settings, "NORMALIZE_MODE", "gain")
+    assert loudness.filter_args(None) == ["-af", loudness.LOUDNORM]   # nothing measured yet
+    monkeypatch.setattr(settings, "NORMALIZE_MODE", "loudnorm")
+    assert loudness.filter_args({"integrated": -23.0, "peak": None}) == ["-af", loudness.LOUDNORM]
+    monkeypatch.setattr(settings, "NORMALIZE_MODE", "louder")
+    with pytest.raises(ValueError):
+        loudness.filter_args(None)
+
+
+# ---------------------------------------------------------------------------
+# Renditions (several outputs from one decode)
+# ---------------------------------------------------------------------------
+
+def test_renditions_encode_from_one_decode(tmp_path, monkeypatch):
+    import asyncio
+    from config import settings
+    from core.extractor import extract_video_file
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "NORMALIZE_MODE", "loudnorm")
+    monkeypatch.setattr(settings, "AUDIO_FORMAT", "mp3")
+    input_path = tmp_path / "in.mp4"
+    input_path.write_bytes(b"\x00")
+    ffmpeg_cmds = []
+
+    async def fake_exec(*cmd, **kwargs):
+        ffmpeg_cmds.append(cmd)
+
+        def write_outputs():
+            for i in range(2):
+                with open(cmd[cmd.index(f"[r{i}]") + 7], "wb") as f:
+                    f.write(b"audio")
+        return _fake_proc(stdout=b"out_time_us=30000000\nprogress=end\n", on_exit=write_outputs)
+
+    renditions = [{"name": "full", "bitrate": "192k"}, {"name": "preview", "format": "opus", "bitrate": "48k"}]
+    job_id = create_job()
+    with patch("asyncio.create_subprocess_exec", fake_exec), \
+         patch("core.extractor._resolve_bin", lambda name: [name]):
+        asyncio.run(extract_video_file(job_id, str(input_path), renditions))
+
+    (cmd,) = ffmpeg_cmds
+    assert cmd.count("-i") == 1
+    assert cmd[cmd.index("-filter_complex") + 1] == "[0:a]loudnorm=I=-16:TP=-1.5:LRA=11,asplit=2[r0][r1]"
+    assert cmd[cmd.index("[r1]") + 1:cmd.index("[r1]") + 7] == ("-acodec", "libopus", "-ab", "48k", "-ar", "48000")
+    job = get_job(job_id)
+    assert job["status"] == JobStatus.done
+    assert job["renditions"] == {
+        "full": str(tmp_path / f"{job_id}.full.mp3"),
+        "preview": str(tmp_path / f"{job_id}.preview.opus"),
+    }
+    assert job["file_path"] == job["renditions"]["full"]
+
+    body = client.get(f"/jobs/{job_id}", headers=HEADERS).json()
+    assert body["renditions"]["preview"] == f"/jobs/{job_id}/download?rendition=preview"
+    res = client.get(f"/jobs/{job_id}/download?rendition=preview")
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "audio/ogg"
+    assert f'filename="{job_id}.preview.opus"' in res.headers["content-disposition"]
+    assert client.get(f"/jobs/{job_id}/download?rendition=nope").status_code == 404
+    delete_job(job_id)
+
+
+def test_renditions_are_validated():
+    res = client.post("/extract/youtube", headers=HEADERS, json={
+        "url": "https://www.youtube.com/watch?v=rendition01",
+        "renditions": [{"name": "a"}, {"name": "a", "bitrate": "64k"}],
+    })
+    assert res.status_code == 422
+    res = client.post("/extract/youtube", headers=HEADERS, json={
+        "url": "https://www.youtube.com/watch?v=rendition01",
+        "renditions": [{"name": "a", "format": "wma"}],
+    })
+    assert res.status_code == 422
+    res = client.post(
+        "/extract/upload", headers=HEADERS,
+        files={"file": ("video.mp4", b"\x00" * 100, "video/mp4")},
+        data={"renditions": '[{"name": "Bad Name"}]'},
+    )
+    assert res.status_code == 422
+
+
+def test_rendition_jobs_bypass_result_cache_but_coalesce():
+    from core.extractor import _youtube_keys
+
+    url = "https://www.youtube.com/watch?v=rendition01"
+    key, flight = _youtube_keys(url, None, [{"name": "a"}])
+    assert key is None
+    assert flight == _youtube_keys(url, None, [{"name": "a"}])[1]
+    assert flight != _youtube_keys(url, None, [{"name": "a", "bitrate": "64k"}])[1]
+    assert flight != _youtube_keys(url, None)[1]
+
+
+def test_cleanup_removes_every_rendition_file(tmp_path):
+    from core.cleanup import job_files
+
+    job = {"file_path": str(tmp_path / "j.a.mp3"),
+           "renditions": {"a": str(tmp_path / "j.a.mp3"), "b": str(tmp_path / "j.b.opus")}}
+    assert sorted(job_files(job)) == [str(tmp_path / "j.a.mp3"), str(tmp_path / "j.b.opus")]
+
+
+# ---------------------------------------------------------------------------
+# Cancellation and child-process lifecycle
+# ---------------------------------------------------------------------------
+
+def test_timeout_kills_the_whole_process_group():
+    import asyncio
+    from core.extractor import _run
+
+    pids = []
+
+    async def run():
+        # The shell stands in for yt-dlp; its background sleep for the ffmpeg it spawns
+        with pytest.raises(asyncio.TimeoutError):
+            await _run(["sh", "-c", "sleep 30 & echo $!; wait"], lambda line: pids.append(int(line)), timeout=0.5)
+
+    asyncio.run(run())
+    (grandchild,) = pids
+    try:
+        with open(f"/proc/{grandchild}/stat") as f:
+            state = f.read().rsplit(")", 1)[1].split()[0]
+    except FileNotFoundError:
+        return   # killed and already reaped
+    assert state == "Z"   # killed; only its (re-parented) zombie entry is left
+
+
+def test_cancel_running_job_frees_slot_and_removes_files(tmp_path, monkeypatch):
+    import asyncio
+    from config import settings
+    from core.scheduler import Scheduler
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "YOUTUBE_CONCURRENCY", 1)
+    job_id = create_job()
+    started = []
+
+    async def stuck(jid):
+        (tmp_path / f"{jid}_input.webm.part").write_bytes(b"\x00")
+        update_job(jid, status=JobStatus.processing)
+        started.append(jid)
+        await asyncio.sleep(60)
+
+    async def run():
+        sched = Scheduler()
+        await sched.start()
+        sched.submit("youtube", job_id, stuck)
+        while not started:
+            await asyncio.sleep(0.01)
+        assert sched.stats()["youtube"]["running"] == 1
+        assert await sched.cancel(job_id)
+        await asyncio.sleep(0)
+        assert sched.stats()["youtube"]["running"] == 0
+        await sched.stop()
+
+    asyncio.run(run())
+    assert get_job(job_id)["status"] == JobStatus.cancelled
+    assert list(tmp_path.iterdir()) == []
+    delete_job(job_id)
+
+
+def test_delete_job_endpoint(tmp_path, monkeypatch):
+    from config import settings
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    assert client.delete("/jobs/no-such-job").status_code == 404
+
+    # Not started by the test client, so the scheduler leaves submitted jobs queued
+    with patch("routes.upload.extract_video_file", new_callable=AsyncMock):
+        res = client.post(
+            "/extract/upload", headers=HEADERS,
+            files={"file": ("video.mp4", b"\x00" * 100, "video/mp4")},
+        )
+    job_id = res.json()["job_id"]
+    assert any(p.name.startswith(job_id) for p in tmp_path.iterdir())
+
+    res = client.delete(f"/jobs/{job_id}")
+    assert res.status_code == 200
+    assert res.json()["status"] == "cancelled"
+    assert not any(p.name.startswith(job_id) for p in tmp_path.iterdir())
+    assert client.get(f"/jobs/{job_id}").json()["queue_position"] is None
+    assert client.delete(f"/jobs/{job_id}").status_code == 409
+    delete_job(job_id)
+
+
+def test_cancelled_follower_is_detached_from_leader():
+    from core import extractor
+
+    extractor._inflight["flight"] = ["follower"]
+    try:
+        assert extractor.detach_follower("follower")
+        assert extractor._inflight["flight"] == []
+        assert not extractor.detach_follower("follower")
+    finally:
+        extractor._inflight.pop("flight")
+
+
+# ---------------------------------------------------------------------------
+# Stage timings and /metrics
+# ---------------------------------------------------------------------------
+
+@pytest.mark.parametrize("returncode", [0, 1])
+def test_upload_job_records_stages_and_outcome(tmp_path, monkeypatch, returncode):
+    import asyncio
+    from config import settings
+    from core import metrics
+    from core.extractor import extract_video_file
+    from core.scheduler import Scheduler
+
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "NORMALIZE_MODE", "off")
+    monkeypatch.setattr(settings, "STREAM_COPY", False)
+    monkeypatch.setattr(metrics, "_jobs", {})
+    monkeypatch.setattr(metrics, "_failures", {})
+    monkeypatch.setattr(metrics, "_histograms", {"stage": {}, "job": {}})
+    input_path = tmp_path / "in.mp4"
+    input_path.write_bytes(b"\x00")
+
+    async def fake_exec(*cmd, **kwargs):
+        return _fake_proc(stdout=b"out_time_us=30000000\nprogress=end\n", returncode=returncode)
+
+    job_id = create_job()
+    with patch("asyncio.create_subprocess_exec", fake_exec), \
+         patch("core.extractor._resolve_bin", lambda name: [name]):
+        asyncio.run(Scheduler().run_tracked("transcode", job_id, extract_video_file(job_id, str(input_path))))
+
+    job = get_job(job_id)
+    expected = ["queued", "started", "encoded", "finished"] if returncode == 0 else ["queued", "started", "finished"]
+    assert list(job["stages"]) == expected
+    assert job["stages"]["queued"] <= job["stages"]["started"] <= job["stages"]["finished"]
+    assert client.get(f"/jobs/{job_id}").json()["stages"] == job["stages"]
+
+    text = client.get("/metrics").text
+    status = "done" if returncode == 0 else "failed"
+    assert f'e2a_jobs_total{{kind="transcode",status="{status}"}} 1' in text
+    assert 'e2a_stage_seconds_count{kind="transcode",stage="started"} 1' in text
+    assert f'e2a_job_seconds_bucket{{kind="transcode",status="{status}",le="+Inf"}} 1' in text
+    if returncode:
+        assert 'e2a_job_failures_total{kind="transcode",error_class="RuntimeError"} 1' in text
+    delete_job(job_id)
+
+
+def test_metrics_endpoint_reports_gauges():
+    res = client.get("/metrics")
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = res.text
+    assert "# TYPE e2a_stage_seconds histogram" in text
+    assert 'e2a_queue_depth{kind="youtube"}' in text
+    assert "e2a_subprocesses_running " in text
+    assert 'e2a_temp_dir_bytes{category="outputs"}' in text
+
+
+def test_ytdlp_stage_prints_mark_the_job():
+    from core.extractor import _ytdlp_line_handler
+
+    job_id = create_job()
+    meta = {}
+    handle = _ytdlp_line_handler(job_id, meta)
+    handle("E2A|stage|resolved")
+    handle("E2A|title|Song")
+    assert meta == {"title": "Song"}
+    assert list(get_job(job_id)["stages"]) == ["queued", "resolved"]
+    delete_job(job_id)
+
+
+# ---------------------------------------------------------------------------
+# Metadata pre-flight
+# ---------------------------------------------------------------------------
+
+_PREFLIGHT_INFO = {
+    "id": "preflight01", "title": "Pre-flight Song", "duration": 240, "filesize": 4_000_000,
+    "url": "https://media.example/audio.m4a", "acodec": "mp4a.40.2",
+    "http_headers": {"User-Agent": "test"}, "webpage_url": "https://www.youtube.com/watch?v=preflight01",
+}
+
+
+def _fake_dump_json(calls, info=None, returncode=0, stderr=b""):
+    import json
+
+    async def fake_exec(*cmd, **kwargs):
+        calls.append(cmd)
+        return _fake_proc(stdout=json.dumps(info or _PREFLIGHT_INFO).encode(), stderr=stderr, returncode=returncode)
+    return fake_exec
+
+
+@pytest.fixture
+def preflight_env(monkeypatch, tmp_path):
+    from config import settings
+    monkeypatch.setattr(settings, "PREFLIGHT", True)
+    monkeypatch.setattr(settings, "TEMP_DIR", str(tmp_path))
+    return settings
+
+
+def test_preflight_returns_title_and_caches_info(preflight_env):
+    calls = []
+    with patch("asyncio.create_subprocess_exec", _fake_dump_json(calls)), \
+         patch("core.extractor._resolve_bin", lambda name: [name]), \
+         patch("routes.youtube.extract_youtube", new_callable=AsyncMock):
+        first = client.post("/extract/youtube", headers=HEADERS, json={"url": "https://youtu.be/preflight01"})
+        second = client.post(
+            "/extract/youtube", headers=HEADERS,
+            json={"url": "https://www.youtube.com/watch?v=preflight01", "start_sec": 5, "end_sec": 20},
+        )
+    assert first.status_code == 202 and second.status_code == 202
+    assert first.json()["title"] == "Pre-flight Song"
+    assert get_job(second.json()["job_id"])["title"] == "Pre-flight Song"
+    assert len(calls) == 1   # both URL forms share the video-ID keyed info cache
+    assert "--dump-single-json" in calls[0]
+    delete_job(first.json()["job_id"])
+    delete_job(second.json()["job_id"])
+
+
+@pytest.mark.parametrize("field,value", [("duration", 7200), ("filesize", 900 * 1024 * 1024)])
+def test_preflight_rejects_video_over_limits(preflight_env, field, value):
+    calls = []
+    info = {**_PREFLIGHT_INFO, field: value}
+    before = len(get_all_jobs())
+    with patch("asyncio.create_subprocess_exec", _fake_dump_json(calls, info)), \
+         patch("core.extractor._resolve_bin", lambda name: [name]), \
+         patch("routes.youtube.extract_youtube", new_callable=AsyncMock) as mock_extract:
+        res = client.post("/extract/youtube", headers=HEADERS, json={"url": "https://youtu.be/preflight01"})
+    assert res.status_code == 422
+    assert "الحد" in res.json()["detail"]
+    assert len(get_all_jobs()) == before
+    mock_extract.assert_not_called()
+
+
+def test_preflight_rejects_unavailable_video(preflight_env):
+    calls = []
+    stderr = b"WARNING: something\nERROR: [youtube] gone0000001: Video unavailable\n"
+    with patch("asyncio.create_subprocess_exec", _fake_dump_json(calls, returncode=1, stderr=stderr)), \
+         patch("core.extractor._resolve_bin", lambda name: [name]):
+        res = client.post("/extract/youtube", headers=HEADERS, json={"url": "https://youtu.be/gone0000001"})
+    assert res.status_code == 422
+    assert res.json()["detail"] == "ERROR: [youtube] gone0000001: Video unavailable"
+
+
+def test_download_reuses_preflight_info(preflight_env):
+    import asyncio
+    import yt_dlp
+    from core.extractor import _ytdlp_args, preflight
+
+    calls = []
+    url = "https://www.youtube.com/watch?v=preflight01"
+    assert "--load-info-json" not in _ytdlp_args("job", url, None)
+    with patch("asyncio.create_subprocess_exec", _fake_dump_json(calls)), \
+         patch("core.extractor._resolve_bin", lambda name: [name]):
+        assert asyncio.run(preflight(url))["title"] == "Pre-flight Song"
+
+    args = _ytdlp_args("job", url, (0, 30))
+    assert url not in args
+    parsed = yt_dlp.parse_options(args)
+    assert parsed.urls == []
+    with open(parsed.options.load_info_filename) as f:
+        assert f.read().startswith('{"id": "preflight01"')
+
+    preflight_env.INFO_CACHE_TTL_SECONDS = 0   # expired: resolve the URL as before
+    assert _ytdlp_args("job", url, None)[-1] == url